@@ -0,0 +1,232 @@
+import itertools
+import queue
+import threading
+import time
+
+# Narration priorities, most urgent first.
+ALERT = 0     # posture reminders, pose correct / lost
+FLOW = 1      # yoga flow instructions
+FEEDBACK = 2  # the running commentary; coalesced and rate-limited
+
+
+def _default_engine():
+    import pyttsx3
+
+    return pyttsx3.init()
+
+
+class SpeechMessage:
+    __slots__ = ("text", "priority", "key", "created", "seq")
+
+    def __init__(self, text, priority, key, created, seq):
+        self.text = text
+        self.priority = priority
+        self.key = key
+        self.created = created
+        self.seq = seq
+
+
+class NarrationService:
+    # One long-lived thread owns the text-to-speech engine; callers only
+    # queue text, so no frame-path thread ever blocks on speech.
+    #
+    # - Pending messages are bounded; when full, the oldest of the least
+    #   urgent ones goes.
+    # - Messages with the same key replace each other while waiting (all
+    #   FEEDBACK shares one key, so only the newest commentary is kept).
+    # - FEEDBACK is spoken at most once per feedback_interval, and any text
+    #   is not repeated within repeat_interval[priority].
+    # - Messages older than max_age[priority] are dropped unspoken.
+    # - A more urgent message, or an ALERT/FLOW message with the same key,
+    #   cuts off the utterance in progress.
+    def __init__(self, engine_factory=None, max_pending=8, feedback_interval=4.0,
+                 repeat_interval=None, max_age=None):
+        self.engine_factory = engine_factory or _default_engine
+        self.max_pending = max_pending
+        self.feedback_interval = feedback_interval
+        self.repeat_interval = repeat_interval or {ALERT: 3.0, FLOW: 0.0, FEEDBACK: 10.0}
+        self.max_age = max_age or {ALERT: 5.0, FLOW: 10.0, FEEDBACK: 1.5}
+        self.enabled = True
+        self.stats = {"spoken": 0, "coalesced": 0, "dropped": 0, "expired": 0, "cancelled": 0}
+        self._pending = []
+        self._current = None
+        self._interrupt = False
+        self._last_said = {}
+        self._last_feedback = 0.0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="narration", daemon=True)
+        self._thread.start()
+
+    def say(self, text, priority=FEEDBACK, key=None):
+        # Returns False when the message was dropped straight away.
+        if not self.enabled or not text:
+            return False
+        if key is None and priority == FEEDBACK:
+            key = "feedback"
+        now = time.monotonic()
+        with self._cond:
+            current = self._current
+            if current is not None and current.text == text:
+                return False
+            last = self._last_said.get(text)
+            if last is not None and now - last < self.repeat_interval.get(priority, 0.0):
+                return False
+            if key is not None:
+                same = [m for m in self._pending if m.key == key]
+                for m in same:
+                    self._pending.remove(m)
+                self.stats["coalesced"] += len(same)
+            elif any(m.text == text for m in self._pending):
+                return False
+            if len(self._pending) >= self.max_pending:
+                worst = max(self._pending, key=lambda m: (m.priority, -m.seq))
+                self.stats["dropped"] += 1
+                if priority > worst.priority:
+                    return False
+                self._pending.remove(worst)
+            self._pending.append(SpeechMessage(text, priority, key, now, next(self._seq)))
+            if current is not None and (
+                priority < current.priority
+                or (key is not None and key == current.key and priority < FEEDBACK)
+            ):
+                self._interrupt = True
+            self._cond.notify_all()
+        return True
+
+    def clear(self):
+        with self._cond:
+            self._pending = []
+            if self._current is not None:
+                self._interrupt = True
+
+    def stop(self, timeout=1.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _next(self, now):
+        expired = [m for m in self._pending if now - m.created > self.max_age.get(m.priority, 5.0)]
+        for m in expired:
+            self._pending.remove(m)
+        self.stats["expired"] += len(expired)
+        ready = [
+            m for m in self._pending
+            if m.priority < FEEDBACK or now - self._last_feedback >= self.feedback_interval
+        ]
+        if not ready:
+            return None
+        msg = min(ready, key=lambda m: (m.priority, m.seq))
+        self._pending.remove(msg)
+        self._last_said[msg.text] = now
+        if msg.priority == FEEDBACK:
+            self._last_feedback = now
+        if len(self._last_said) > 256:
+            cutoff = now - max(self.repeat_interval.values())
+            self._last_said = {t: at for t, at in self._last_said.items() if at >= cutoff}
+        return msg
+
+    def _run(self):
+        try:
+            engine = self.engine_factory()
+        except Exception as e:
+            print("Narration Error:", e)
+            return
+        # Driving the engine's loop from here lets this thread stop an
+        # utterance midway. Drivers without an external loop speak each
+        # message to the end instead.
+        try:
+            engine.startLoop(False)
+            looped = True
+        except Exception:
+            looped = False
+        try:
+            while True:
+                if looped:
+                    engine.iterate()
+                with self._cond:
+                    if self._stopped:
+                        break
+                    if self._current is not None:
+                        if self._interrupt:
+                            engine.stop()
+                            self.stats["cancelled"] += 1
+                            self._current = None
+                        elif not engine.isBusy():
+                            self._current = None
+                    self._interrupt = False
+                    msg = None
+                    if self._current is None:
+                        msg = self._next(time.monotonic())
+                        self._current = msg
+                    if msg is None:
+                        # Speaking: poll the engine. Idle: sleep until a
+                        # message arrives or rate-limited feedback is due.
+                        self._cond.wait(0.02 if self._current is not None else 0.25)
+                        continue
+                engine.say(msg.text)
+                self.stats["spoken"] += 1
+                if not looped:
+                    engine.runAndWait()
+                    with self._cond:
+                        self._current = None
+        except Exception as e:
+            print("Narration Error:", e)
+        finally:
+            if looped:
+                try:
+                    engine.endLoop()
+                except Exception:
+                    pass
+
+
+class MusicService:
+    # pygame.mixer lives on its own thread too; play() and stop() only
+    # queue a command, so loading a track never stalls the GUI.
+    def __init__(self):
+        self.playing = False
+        self._commands = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="music", daemon=True)
+        self._thread.start()
+
+    def play(self, path, loops=-1):
+        self._commands.put(("play", path, loops))
+
+    def stop(self):
+        self._commands.put(("stop",))
+
+    def set_volume(self, volume):
+        self._commands.put(("volume", volume))
+
+    def close(self, timeout=1.0):
+        self._commands.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            import pygame
+
+            pygame.mixer.init()
+        except Exception as e:
+            print("Music Error:", e)
+            return
+        while True:
+            command = self._commands.get()
+            if command is None:
+                break
+            try:
+                if command[0] == "play":
+                    pygame.mixer.music.load(command[1])
+                    pygame.mixer.music.play(command[2])
+                    self.playing = True
+                elif command[0] == "stop":
+                    pygame.mixer.music.stop()
+                    self.playing = False
+                elif command[0] == "volume":
+                    pygame.mixer.music.set_volume(command[1])
+            except Exception as e:
+                print("Music Error:", e)
+                self.playing = False
+        pygame.mixer.quit()
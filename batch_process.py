@@ -0,0 +1,255 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from landmark_store import LandmarkWriter, check_format
+from landmark_filter import PoseSmoother
+from pose_analysis import PoseAnalyzer
+from pose_library import PoseLibrary
+from pose_rules import load_rules
+from pose_landmarks import NUM_HAND_LANDMARKS, NUM_POSE_LANDMARKS, PoseFrame
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+IMAGE_SEQUENCE_FPS = 30.0
+
+# Per-process MediaPipe graphs, built once by the pool initializer.
+_models = None
+
+
+def _init_worker(model_complexity, with_hands):
+    global _models
+    import mediapipe as mp
+
+    pose = mp.solutions.pose.Pose(model_complexity=model_complexity)
+    hands = mp.solutions.hands.Hands() if with_hands else None
+    _models = (pose, hands)
+
+
+def _list_images(folder):
+    return sorted(
+        p for p in glob.glob(os.path.join(glob.escape(folder), '*'))
+        if p.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+
+def plan_jobs(paths, segment_seconds=120.0):
+    # Splits every input into (path, kind, start, stop, fps) segments. A
+    # folder contributes its videos, plus one image sequence if it holds
+    # images.
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    jobs.extend(_video_jobs(os.path.join(path, name), segment_seconds))
+            images = _list_images(path)
+            if images:
+                step = max(1, int(segment_seconds * IMAGE_SEQUENCE_FPS))
+                for start in range(0, len(images), step):
+                    jobs.append((path, 'images', start, min(start + step, len(images)), IMAGE_SEQUENCE_FPS))
+        else:
+            jobs.extend(_video_jobs(path, segment_seconds))
+    return jobs
+
+
+def _video_jobs(path, segment_seconds):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print("Skipping unreadable file:", path)
+        return []
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if count <= 0:
+        return [(path, 'video', 0, None, fps)]
+    step = max(1, int(segment_seconds * fps))
+    return [(path, 'video', start, min(start + step, count), fps) for start in range(0, count, step)]
+
+
+def _frames(path, kind, start, stop):
+    if kind == 'images':
+        for index, image_path in enumerate(_list_images(path)[start:stop], start):
+            frame = cv2.imread(image_path)
+            if frame is not None:
+                yield index, frame
+        return
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    while stop is None or index < stop:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield index, frame
+        index += 1
+    cap.release()
+
+
+def run_segment(job, mirror=False):
+    # Inference only; the stateful scoring happens in the parent once the
+    # segments of a file are back in order.
+    path, kind, start, stop, fps = job
+    pose, hands = _models
+    # The graphs are reused across segments in whatever order the pool
+    # hands them out; start each segment without the last one's tracking.
+    pose.reset()
+    if hands is not None:
+        hands.reset()
+    started = time.perf_counter()
+    indices, landmarks, hand_arrays = [], [], []
+    processed = 0
+    for index, frame in _frames(path, kind, start, stop):
+        processed += 1
+        if mirror:
+            frame = cv2.flip(frame, 1)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        pose_frame = PoseFrame.from_results(pose.process(rgb))
+        if pose_frame is None:
+            continue
+        indices.append(index)
+        landmarks.append(pose_frame.data)
+        if hands is not None:
+            hand_arrays.append(_hand_array(hands.process(rgb)))
+    result = {
+        "job": job,
+        "processed": processed,
+        "seconds": time.perf_counter() - started,
+        "frame": np.array(indices, np.int64),
+        "landmarks": np.array(landmarks, np.float32).reshape(-1, NUM_POSE_LANDMARKS, 4),
+    }
+    if hands is not None:
+        result["hands"] = np.array(hand_arrays, np.float32).reshape(-1, 2, NUM_HAND_LANDMARKS, 3)
+    return result
+
+
+def _hand_array(hands_results):
+    # Up to two hands, NaN where a hand wasn't found.
+    out = np.full((2, NUM_HAND_LANDMARKS, 3), np.nan, np.float32)
+    for i, hand in enumerate((hands_results.multi_hand_landmarks or [])[:2]):
+        out[i] = [(lm.x, lm.y, lm.z) for lm in hand.landmark]
+    return out
+
+
+def _run_segment_star(args):
+    return run_segment(*args)
+
+
+def _finish_file(path, segments, output_dir, fmt, rules=None, pose_library=None):
+    segments.sort(key=lambda r: r["job"][2])
+    fps = segments[0]["job"][4]
+    stem = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    writer = LandmarkWriter(os.path.join(output_dir, f"{stem}.landmarks.{fmt}"))
+    analyzer = PoseAnalyzer(rules, pose_library)
+    smoother = PoseSmoother()
+    events = []
+    for seg in segments:
+        timestamps = seg["frame"] / fps
+        chunk = {"frame": seg["frame"], "timestamp": timestamps, "landmarks": seg["landmarks"]}
+        if "hands" in seg:
+            chunk["hands"] = seg["hands"]
+        if len(seg["frame"]):
+            # Offline there is no frame deadline, so wait for the disk
+            # rather than drop landmarks.
+            writer.submit(chunk, block=True)
+        for index, ts, data in zip(seg["frame"], timestamps, seg["landmarks"]):
+            # Scored on smoothed landmarks, like the live view; the landmark
+            # files keep the raw model output.
+            pose_frame = smoother.update(PoseFrame(data), ts)
+            for name, value in analyzer.analyze(pose_frame, timestamp=ts).events:
+                events.append((int(index), float(ts), name, value))
+    writer.close()
+    if writer.error is not None:
+        print(f"{path}: landmark output failed: {writer.error}")
+
+    with open(os.path.join(output_dir, f"{stem}.events.csv"), 'w', newline='') as f:
+        out = csv.writer(f)
+        out.writerow(['frame', 'timestamp', 'event', 'value'])
+        out.writerows(events)
+
+    return {
+        "path": path,
+        "error": None if writer.error is None else str(writer.error),
+        "landmark_frames": writer.frames_written,
+        "frames": sum(seg["processed"] for seg in segments),
+        "pose_frames": sum(len(seg["frame"]) for seg in segments),
+        "segments": len(segments),
+        "reps": analyzer.rep_count,
+        "posture_alerts": sum(1 for e in events if e[2] == "posture"),
+        "worker_seconds": sum(seg["seconds"] for seg in segments),
+    }
+
+
+def process_paths(paths, output_dir, workers=None, segment_seconds=120.0, fmt='npz',
+                  model_complexity=1, hands=False, mirror=False, rules_path=None,
+                  library_path=None):
+    check_format(fmt)
+    os.makedirs(output_dir, exist_ok=True)
+    rules = load_rules(rules_path)
+    pose_library = PoseLibrary.load(library_path) if library_path else None
+    jobs = plan_jobs(paths, segment_seconds)
+    remaining = {}
+    for job in jobs:
+        remaining[job[0]] = remaining.get(job[0], 0) + 1
+    done = {path: [] for path in remaining}
+    files = []
+    started = time.perf_counter()
+    with Pool(workers, initializer=_init_worker, initargs=(model_complexity, hands)) as pool:
+        for result in pool.imap_unordered(_run_segment_star, [(job, mirror) for job in jobs]):
+            path = result["job"][0]
+            done[path].append(result)
+            remaining[path] -= 1
+            if remaining[path] == 0:
+                files.append(_finish_file(path, done.pop(path), output_dir, fmt, rules, pose_library))
+                print(f"{path}: {files[-1]['frames']} frames, {files[-1]['reps']} reps")
+    wall = time.perf_counter() - started
+    frames = sum(f["frames"] for f in files)
+    summary = {
+        "files": files,
+        "failed": [f["path"] for f in files if f["error"] is not None],
+        "frames": frames,
+        "wall_seconds": wall,
+        "fps": frames / wall if wall > 0 else 0.0,
+        "workers": workers or os.cpu_count(),
+        "model_complexity": model_complexity,
+    }
+    with open(os.path.join(output_dir, "summary.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score recorded sessions offline across worker processes.")
+    parser.add_argument("inputs", nargs='+', help="video files or folders of videos/images")
+    parser.add_argument("-o", "--output", default="batch_output", help="output folder")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--segment-seconds", type=float, default=120.0, help="split long videos into segments of this length")
+    parser.add_argument("--format", choices=['npz', 'csv', 'parquet'], default='npz', help="landmark output format")
+    parser.add_argument("--model-complexity", type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument("--hands", action="store_true", help="also run the hand model")
+    parser.add_argument("--mirror", action="store_true", help="flip frames horizontally like the live view")
+    parser.add_argument("--rules", default=None, help="rules file (default: pose_rules.json)")
+    parser.add_argument("--library", default=None, help="custom pose library (.npy) to match against")
+    args = parser.parse_args(argv)
+
+    summary = process_paths(
+        args.inputs, args.output, workers=args.workers, segment_seconds=args.segment_seconds,
+        fmt=args.format, model_complexity=args.model_complexity, hands=args.hands, mirror=args.mirror,
+        rules_path=args.rules, library_path=args.library,
+    )
+    print(f"{summary['frames']} frames from {len(summary['files'])} files in "
+          f"{summary['wall_seconds']:.1f}s ({summary['fps']:.1f} fps, {summary['workers']} workers)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
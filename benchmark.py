@@ -0,0 +1,100 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+
+from frame_sources import open_source
+from pose_inference import InferenceScheduler
+from pose_metrics import StageMetrics
+from pose_pipeline import FrameEngine
+
+REPORT_STAGES = ("capture", "convert", "pose", "hands", "inference", "render", "latency")
+
+
+def run_config(source_spec, model_complexity, hands_enabled, hands_every, frames, warmup, hands_complexity=1):
+    import mediapipe as mp
+
+    # The hand model has its own setting, fixed across runs, so the
+    # complexity column only measures the pose model.
+    pose = mp.solutions.pose.Pose(model_complexity=model_complexity)
+    hands = mp.solutions.hands.Hands(model_complexity=hands_complexity) if hands_enabled else None
+    metrics = StageMetrics()
+    scheduler = InferenceScheduler(pose, hands, hands_every=hands_every)
+    # Lossless queues: every frame of the replay goes through every stage,
+    # so runs with different settings see exactly the same input.
+    engine = FrameEngine(open_source(source_spec), scheduler=scheduler, metrics=metrics, lossless=True)
+    engine.start()
+    measured_from = None
+    start_frames = 0
+    while not engine.wait(0.01):
+        if measured_from is None and engine.frames_processed >= warmup:
+            metrics.reset()
+            measured_from = time.perf_counter()
+            start_frames = engine.frames_processed
+        if engine.frames_processed >= warmup + frames:
+            break
+    end = time.perf_counter()
+    processed = engine.frames_processed - start_frames
+    engine.stop()
+    pose.close()
+    if hands is not None:
+        hands.close()
+    elapsed = end - measured_from if measured_from else 0.0
+    return {
+        "model_complexity": model_complexity,
+        "hands": hands_enabled,
+        "hands_complexity": hands_complexity if hands_enabled else None,
+        "hands_every": hands_every,
+        "frames": processed,
+        "seconds": elapsed,
+        "fps": processed / elapsed if elapsed > 0 else 0.0,
+        "stages": metrics.snapshot(),
+    }
+
+
+def format_row(result):
+    cells = [
+        f"{result['model_complexity']:>4}",
+        f"{'on' if result['hands'] else 'off':>5}",
+        f"{result['hands_every']:>5}",
+        f"{result['fps']:>7.1f}",
+    ]
+    for stage in REPORT_STAGES:
+        s = result["stages"].get(stage, {"count": 0})
+        cells.append(f"{s['p50_ms']:>7.1f}/{s['p95_ms']:<7.1f}" if s["count"] else f"{'-':>15}")
+    return " ".join(cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a video through the pipeline under different model settings.")
+    parser.add_argument("source", help="video file, frame cache (.npy), image folder or 'synthetic'")
+    parser.add_argument("--complexity", type=int, nargs='+', default=[0, 1, 2], choices=[0, 1, 2])
+    parser.add_argument("--hands", choices=['on', 'off'], nargs='+', default=['on', 'off'])
+    parser.add_argument("--hands-every", type=int, nargs='+', default=[1])
+    parser.add_argument("--hands-complexity", type=int, default=1, choices=[0, 1],
+                        help="hand model complexity, the same for every run")
+    parser.add_argument("--frames", type=int, default=300, help="frames measured per configuration")
+    parser.add_argument("--warmup", type=int, default=30, help="frames run before measuring")
+    parser.add_argument("--json", help="write the full results here")
+    args = parser.parse_args(argv)
+
+    print(f"hand model complexity {args.hands_complexity}")
+    print(f"{'cplx':>4} {'hands':>5} {'every':>5} {'fps':>7} "
+          + " ".join(f"{stage + ' p50/p95':>15}" for stage in REPORT_STAGES))
+    results = []
+    for complexity, hands, every in itertools.product(args.complexity, args.hands, args.hands_every):
+        if hands == 'off' and every != args.hands_every[0]:
+            continue
+        result = run_config(args.source, complexity, hands == 'on', every, args.frames, args.warmup,
+                            args.hands_complexity)
+        results.append(result)
+        print(format_row(result))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"source": args.source, "hands_complexity": args.hands_complexity, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
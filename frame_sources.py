@@ -0,0 +1,284 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Every source has the cv2.VideoCapture surface the pipeline uses
+# (read / isOpened / release) plus:
+#   read(image) decodes into `image` when it has the right shape and
+#              returns it, like cv2.VideoCapture.read, so the pipeline can
+#              reuse buffers. Sources that can't simply ignore it.
+#   is_live    True for real cameras: a failed read is transient, not the end
+#   timestamp  time of the frame returned by the last read(), in seconds.
+#              Wall clock for cameras, media time for everything else, so a
+#              replay produces the same timestamps every run.
+
+
+class Pacer:
+    # Sleeps so frames come out no faster than their media timestamps.
+    def __init__(self):
+        self._origin = None
+
+    def wait(self, media_time):
+        now = time.monotonic()
+        if self._origin is None:
+            self._origin = now - media_time
+            return
+        delay = self._origin + media_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CameraSource:
+    is_live = True
+
+    def __init__(self, index=0, width=640, height=480):
+        self.index = index
+        self.cap = cv2.VideoCapture(index)
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.timestamp = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image)
+        self.timestamp = time.time()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+def count_cameras(max_index=2):
+    count = 0
+    for i in range(max_index):
+        cap = cv2.VideoCapture(i)
+        if cap.isOpened():
+            count += 1
+            cap.release()
+    return count
+
+
+class VideoFileSource:
+    # Plays a file as fast as it decodes, or at native speed with realtime=True.
+    is_live = False
+
+    def __init__(self, path, realtime=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.realtime = realtime
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.index = 0
+        self.timestamp = None
+        self._pacer = Pacer()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self, image=None):
+        ret, frame = self.cap.read(image)
+        if not ret:
+            return ret, frame
+        # Container timestamps keep variable-rate files honest; fall back to
+        # index / fps where the backend doesn't report them.
+        pos = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        self.timestamp = pos / 1000.0 if pos > 0 or self.index == 0 else self.index / self.fps
+        self.index += 1
+        if self.realtime:
+            self._pacer.wait(self.timestamp)
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageSequenceSource:
+    # Folder of images (or an explicit list) played in sorted order at `fps`.
+    is_live = False
+
+    def __init__(self, paths, fps=30.0, realtime=False, loop=False):
+        if isinstance(paths, str):
+            paths = sorted(
+                p for p in glob.glob(os.path.join(glob.escape(paths), '*'))
+                if p.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        self.paths = list(paths)
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self.timestamp = None
+        self._pacer = Pacer()
+
+    def isOpened(self):
+        return self.index < len(self.paths) or (self.loop and bool(self.paths))
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        frame = cv2.imread(self.paths[self.index % len(self.paths)])
+        self.timestamp = self.index / self.fps
+        self.index += 1
+        if self.realtime:
+            self._pacer.wait(self.timestamp)
+        return frame is not None, frame
+
+    def release(self):
+        self.paths = []
+
+
+class SyntheticSource:
+    # Deterministic moving test pattern so the pipeline can run with no
+    # camera attached. frames=None runs forever.
+    is_live = False
+
+    def __init__(self, width=640, height=480, frames=300, fps=30.0, realtime=False):
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.fps = fps
+        self.realtime = realtime
+        self.index = 0
+        self.timestamp = None
+        self._pacer = Pacer()
+        ramp = np.linspace(0, 255, width, dtype=np.uint8)
+        self._base = np.repeat(ramp[None, :], height, axis=0)
+
+    def isOpened(self):
+        return self.frames is None or self.index < self.frames
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        self.timestamp = self.index / self.fps
+        shift = (self.index * 4) % self.width
+        shape = (self.height, self.width, 3)
+        frame = image if image is not None and image.shape == shape else np.empty(shape, np.uint8)
+        frame[:, :, 0] = np.roll(self._base, shift, axis=1)
+        frame[:, :, 1] = self._base[:, ::-1]
+        frame[:, :, 2] = 128
+        cx = int((0.5 + 0.3 * np.sin(self.index / 15.0)) * self.width)
+        cv2.circle(frame, (cx, self.height // 2), self.height // 8, (255, 255, 255), -1)
+        self.index += 1
+        if self.realtime:
+            self._pacer.wait(self.timestamp)
+        return True, frame
+
+    def release(self):
+        self.frames = 0
+
+
+def build_frame_cache(source, path, max_frames=None):
+    # Decodes `source` once into <path> (an .npy of shape (n, h, w, 3)) and
+    # <path stem>.timestamps.npy, so later runs skip decoding entirely.
+    # Frames are spooled to disk as they decode, never held in memory.
+    raw_path = path + '.part'
+    stamps = []
+    shape = None
+    with open(raw_path, 'wb') as raw:
+        while max_frames is None or len(stamps) < max_frames:
+            ret, frame = source.read()
+            if not ret:
+                break
+            if shape is None:
+                shape = frame.shape
+            elif frame.shape != shape:
+                raise ValueError("All cached frames must have the same size")
+            raw.write(np.ascontiguousarray(frame, np.uint8).tobytes())
+            stamps.append(source.timestamp if source.timestamp is not None else len(stamps) / 30.0)
+    source.release()
+    try:
+        if not stamps:
+            raise ValueError("Source produced no frames to cache")
+        spooled = np.memmap(raw_path, dtype=np.uint8, mode='r', shape=(len(stamps),) + shape)
+        cache = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=spooled.shape)
+        for start in range(0, len(stamps), 64):
+            cache[start:start + 64] = spooled[start:start + 64]
+        cache.flush()
+        del cache, spooled
+    finally:
+        os.remove(raw_path)
+    np.save(_timestamps_path(path), np.array(stamps, np.float64))
+    return len(stamps)
+
+
+def _timestamps_path(path):
+    return os.path.splitext(path)[0] + '.timestamps.npy'
+
+
+class CachedSource:
+    # Replays a cache made by build_frame_cache. Frames come straight from a
+    # read-only memory map; each read copies the frame out (into the
+    # caller's buffer when one is passed) so the pipeline can draw on it.
+    is_live = False
+
+    def __init__(self, path, realtime=False, loop=False):
+        self.frames = np.load(path, mmap_mode='r')
+        ts_path = _timestamps_path(path)
+        self.timestamps = np.load(ts_path) if os.path.exists(ts_path) else np.arange(len(self.frames)) / 30.0
+        self.realtime = realtime
+        self.loop = loop
+        self.index = 0
+        self.timestamp = None
+        self._pacer = Pacer()
+
+    def isOpened(self):
+        return self.frames is not None and (self.loop or self.index < len(self.frames))
+
+    def read(self, image=None):
+        if not self.isOpened():
+            return False, None
+        i = self.index % len(self.frames)
+        # Looping keeps timestamps increasing across passes.
+        span = self.timestamps[-1] + (self.timestamps[1] - self.timestamps[0] if len(self.timestamps) > 1 else 1 / 30.0)
+        self.timestamp = float(self.timestamps[i] + (self.index // len(self.frames)) * span)
+        self.index += 1
+        if self.realtime:
+            self._pacer.wait(self.timestamp)
+        if image is not None and image.shape == self.frames.shape[1:]:
+            np.copyto(image, self.frames[i])
+            return True, image
+        return True, np.array(self.frames[i])
+
+    def release(self):
+        self.frames = None
+
+
+def open_source(spec, width=640, height=480, realtime=False):
+    # spec: camera index, "synthetic", a folder of images, a frame cache
+    # (.npy) or a video file.
+    spec = str(spec)
+    if spec == "synthetic":
+        return SyntheticSource(width, height, realtime=realtime)
+    if spec.isdigit():
+        return CameraSource(int(spec), width, height)
+    if os.path.isdir(spec):
+        return ImageSequenceSource(spec, realtime=realtime)
+    if spec.endswith('.npy'):
+        return CachedSource(spec, realtime=realtime)
+    return VideoFileSource(spec, realtime=realtime)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-decode a source into a memory-mapped frame cache.")
+    parser.add_argument("source", help="video file, image folder or 'synthetic'")
+    parser.add_argument("cache", help="output .npy path")
+    parser.add_argument("--max-frames", type=int, default=None)
+    args = parser.parse_args(argv)
+    count = build_frame_cache(open_source(args.source), args.cache, args.max_frames)
+    print(f"Cached {count} frames to {args.cache}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import math
+
+import cv2
+import numpy as np
+
+from pose_landmarks import PoseFrame
+
+
+def _alpha(cutoff, dt):
+    tau = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + tau / dt)
+
+
+class OneEuroFilter:
+    # One Euro filter (Casiez et al.) over a whole array at once: every
+    # element gets its own adaptive cutoff, so still landmarks are smoothed
+    # hard while fast ones follow with little lag. min_cutoff is in Hz,
+    # beta scales the cutoff with speed (units per second).
+    def __init__(self, min_cutoff=1.0, beta=5.0, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = None
+        self.t = None
+
+    def __call__(self, x, t):
+        x = np.asarray(x, np.float32)
+        if self.x is None or self.x.shape != x.shape:
+            self.x = x.copy()
+            self.dx = np.zeros_like(x)
+            self.t = t
+            return self.x.copy()
+        # Repeated timestamps (replays without timing) count as one frame.
+        dt = t - self.t if t > self.t else 1.0 / 30.0
+        self.dx += _alpha(self.d_cutoff, dt) * ((x - self.x) / dt - self.dx)
+        cutoff = self.min_cutoff + self.beta * np.abs(self.dx)
+        tau = 1.0 / (2.0 * np.pi * cutoff)
+        self.x += (x - self.x) / (1.0 + tau / dt)
+        self.t = t
+        return self.x.copy()
+
+
+class PoseSmoother:
+    # Smooths a person's landmark positions over time and, on frames where
+    # the pose model didn't run, extrapolates them from the filter's speed
+    # estimate. Extrapolation stops after max_extrapolation seconds so a
+    # long skip holds the last position rather than drifting away.
+    def __init__(self, min_cutoff=1.0, beta=5.0, d_cutoff=1.0, max_extrapolation=0.25):
+        self.filter = OneEuroFilter(min_cutoff, beta, d_cutoff)
+        self.max_extrapolation = max_extrapolation
+        self.visibility = None
+
+    def reset(self):
+        self.filter.reset()
+        self.visibility = None
+
+    def update(self, pose_frame, t):
+        if pose_frame is None:
+            # Nobody in view: start fresh when someone comes back.
+            self.reset()
+            return None
+        data = pose_frame.data.copy()
+        data[:, :3] = self.filter(pose_frame.xyz, t)
+        self.visibility = pose_frame.visibility.copy()
+        return PoseFrame(data)
+
+    def predict(self, t):
+        f = self.filter
+        if f.x is None:
+            return None
+        ahead = min(max(t - f.t, 0.0), self.max_extrapolation)
+        data = np.empty((len(f.x), 4), np.float32)
+        data[:, :3] = f.x + f.dx * ahead
+        data[:, 3] = self.visibility
+        return PoseFrame(data)
+
+    def process(self, pose_results, t, fresh=True):
+        # fresh: the results come from a model run on this frame, rather
+        # than being held over from an earlier one.
+        if fresh:
+            return self.update(PoseFrame.from_results(pose_results), t)
+        return self.predict(t)
+
+
+class MotionGate:
+    # Cheap "did anything move?" check: compares a small grayscale
+    # thumbnail with the one from the last frame that went through the
+    # models. Moving when more than min_changed of the thumbnail's pixels
+    # changed by more than pixel_threshold, so a small moving limb counts
+    # and sensor noise doesn't. After max_skip static frames it reports
+    # motion anyway, so slow drift is still picked up.
+    def __init__(self, size=(80, 60), pixel_threshold=20, min_changed=0.003, max_skip=10):
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.max_skip = max_skip
+        self.skipped = 0
+        self._reference = None
+
+    def moving(self, image):
+        thumb = cv2.resize(image, self.size, interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 3:
+            thumb = cv2.cvtColor(thumb, cv2.COLOR_RGB2GRAY)
+        reference = self._reference
+        if reference is not None and self.skipped < self.max_skip:
+            changed = np.count_nonzero(cv2.absdiff(thumb, reference) > self.pixel_threshold)
+            if changed < self.min_changed * thumb.size:
+                self.skipped += 1
+                return False
+        self._reference = thumb
+        self.skipped = 0
+        return True
+
+    def reset(self):
+        self._reference = None
+        self.skipped = 0
@@ -0,0 +1,200 @@
+import glob
+import os
+import queue
+import threading
+
+import numpy as np
+
+CSV_HEADER = "frame,landmark_id,x,y,z,visibility,timestamp"
+CSV_FORMAT = ['%d', '%d', '%.6f', '%.6f', '%.6f', '%.4f', '%.6f']
+
+
+class LandmarkStore:
+    # Fixed-size ring of per-frame pose arrays. Keeps the last `capacity`
+    # frames in memory and, while a writer is attached, hands every
+    # `chunk_size` new frames to it so disk output grows while memory doesn't.
+    def __init__(self, capacity=1800, chunk_size=150, num_landmarks=33):
+        self.capacity = max(capacity, chunk_size)
+        self.chunk_size = chunk_size
+        self.frames = np.zeros(self.capacity, np.int64)
+        self.timestamps = np.zeros(self.capacity, np.float64)
+        self.landmarks = np.zeros((self.capacity, num_landmarks, 4), np.float32)
+        self.count = 0
+        self.writer = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, frame_index, timestamp, landmarks):
+        with self._lock:
+            i = self.count % self.capacity
+            self.frames[i] = frame_index
+            self.timestamps[i] = timestamp
+            self.landmarks[i] = landmarks
+            self.count += 1
+            if self.writer is not None:
+                self._pending += 1
+                if self._pending >= self.chunk_size:
+                    self._emit()
+
+    def snapshot(self):
+        with self._lock:
+            return self._take(len(self))
+
+    def clear(self):
+        with self._lock:
+            self.count = 0
+            self._pending = 0
+
+    def attach_writer(self, writer, backlog=True):
+        # With backlog=True the frames already in memory are written first.
+        with self._lock:
+            self.writer = writer
+            self._pending = len(self) if backlog else 0
+            if self._pending:
+                self._emit()
+
+    def detach_writer(self):
+        with self._lock:
+            writer = self.writer
+            if writer is not None and self._pending:
+                self._emit()
+            self.writer = None
+            self._pending = 0
+            return writer
+
+    def _take(self, n):
+        idx = np.arange(self.count - n, self.count) % self.capacity
+        return {
+            "frame": self.frames[idx],
+            "timestamp": self.timestamps[idx],
+            "landmarks": self.landmarks[idx],
+        }
+
+    def _emit(self):
+        n = min(self._pending, len(self))
+        self._pending = 0
+        if n:
+            self.writer.submit(self._take(n))
+
+
+def chunk_rows(chunk):
+    # Long layout, one row per landmark: frame, landmark_id, x, y, z,
+    # visibility, timestamp.
+    landmarks = chunk["landmarks"]
+    n, k, _ = landmarks.shape
+    rows = np.empty((n, k, 7), np.float64)
+    rows[:, :, 0] = chunk["frame"][:, None]
+    rows[:, :, 1] = np.arange(k)
+    rows[:, :, 2:6] = landmarks
+    rows[:, :, 6] = chunk["timestamp"][:, None]
+    return rows.reshape(-1, 7)
+
+
+def check_format(fmt):
+    # Raises before any work starts if the writer can't handle fmt.
+    if fmt not in ('csv', 'npz', 'parquet'):
+        raise ValueError(f"Unsupported landmark format: {fmt}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+class LandmarkWriter:
+    # Streams landmark chunks to disk on its own thread. submit() and
+    # close(wait=False) never block the caller: chunks that arrive while
+    # max_pending are already waiting are dropped and counted (offline
+    # callers pass block=True to wait instead), and after a write error
+    # (kept in .error) everything else is discarded.
+    #   .csv      one growing CSV file
+    #   .npz      one numbered .npz per chunk next to the given path
+    #   .parquet  one row group per chunk (needs pyarrow)
+    def __init__(self, path, fmt=None, max_pending=8):
+        self.path = path
+        self.fmt = (fmt or os.path.splitext(path)[1].lstrip('.') or 'csv').lower()
+        check_format(self.fmt)
+        self.frames_written = 0
+        self.chunks_written = 0
+        self.chunks_dropped = 0
+        self.error = None
+        self._closed = False
+        self._file = None
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, chunk, block=False):
+        if self._closed or self.error is not None:
+            self.chunks_dropped += 1
+            return
+        if block:
+            self._queue.put(chunk)
+            return
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            self.chunks_dropped += 1
+
+    def close(self, wait=True, timeout=None):
+        # The writer finishes what is queued, then stops.
+        self._closed = True
+        if wait:
+            self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    chunk = self._queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self._closed:
+                        break
+                    continue
+                if self.error is not None:
+                    self.chunks_dropped += 1
+                    continue
+                try:
+                    self._write(chunk)
+                except Exception as e:
+                    print("Landmark Export Error:", e)
+                    self.error = e
+        finally:
+            if self._file is not None:
+                self._file.close()
+
+    def _write(self, chunk):
+        if self.fmt == 'csv':
+            if self._file is None:
+                self._file = open(self.path, 'w', newline='')
+                self._file.write(CSV_HEADER + '\n')
+            np.savetxt(self._file, chunk_rows(chunk), delimiter=',', fmt=CSV_FORMAT)
+            self._file.flush()
+        elif self.fmt == 'npz':
+            stem = os.path.splitext(self.path)[0]
+            np.savez(f"{stem}.{self.chunks_written:05d}.npz", **chunk)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            rows = chunk_rows(chunk)
+            table = pa.table({
+                name: rows[:, i].astype(np.int64 if i < 2 else np.float64)
+                for i, name in enumerate(CSV_HEADER.split(','))
+            })
+            if self._file is None:
+                self._file = pq.ParquetWriter(self.path, table.schema)
+            self._file.write_table(table)
+        self.chunks_written += 1
+        self.frames_written += len(chunk["frame"])
+
+
+def read_npz_chunks(path):
+    stem = os.path.splitext(path)[0]
+    parts = sorted(glob.glob(glob.escape(stem) + ".[0-9][0-9][0-9][0-9][0-9].npz"))
+    if not parts:
+        return None
+    loaded = [np.load(p) for p in parts]
+    return {key: np.concatenate([part[key] for part in loaded]) for key in ("frame", "timestamp", "landmarks")}
@@ -0,0 +1,207 @@
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from landmark_filter import PoseSmoother
+from pose_analysis import PoseAnalyzer
+from pose_landmarks import PoseFrame
+
+
+class HogPersonDetector:
+    # OpenCV's built-in HOG people detector on a downscaled frame. Cheap
+    # enough to run every few frames; any callable returning (x0, y0, x1, y1)
+    # pixel boxes can stand in for it.
+    def __init__(self, scale=0.5, min_score=0.3):
+        self.scale = scale
+        self.min_score = min_score
+        self.hog = cv2.HOGDescriptor()
+        self.hog.setSVMDetector(cv2.HOGDescriptor_getDefaultPeopleDetector())
+
+    def __call__(self, image):
+        small = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        rects, weights = self.hog.detectMultiScale(small, winStride=(8, 8), padding=(8, 8), scale=1.05)
+        if len(rects) == 0:
+            return np.zeros((0, 4), np.float32)
+        weights = np.asarray(weights, np.float32).reshape(-1)
+        keep = cv2.dnn.NMSBoxes(rects.tolist(), weights.tolist(), self.min_score, 0.4)
+        keep = np.asarray(keep, np.intp).reshape(-1)
+        rects = rects[keep].astype(np.float32) / self.scale
+        rects[:, 2:] += rects[:, :2]
+        return rects
+
+
+def box_iou(a, b):
+    # Pairwise IoU of two (n, 4) / (m, 4) box arrays -> (n, m).
+    a = np.asarray(a, np.float32).reshape(-1, 4)[:, None, :]
+    b = np.asarray(b, np.float32).reshape(-1, 4)[None, :, :]
+    ix = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    iy = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = ix * iy
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class TrackedPerson:
+    # Everything that belongs to one tracked person: their ROI, their own
+    # MediaPipe Pose graph (its temporal tracking must not mix people) and
+    # their own rep/posture/flow state.
+    def __init__(self, person_id, box, pose, rules=None, pose_library=None):
+        self.id = person_id
+        self.box = np.asarray(box, np.float32)
+        self.pose = pose
+        self.analyzer = PoseAnalyzer(rules, pose_library)
+        self.smoother = PoseSmoother()
+        self.pose_frame = None
+        self.missed = 0
+        self.age = 0
+
+
+class MultiPersonTracker:
+    # Runs the detector only every `detect_every` frames (or when nobody is
+    # tracked). In between, each person's ROI follows their own landmarks.
+    # Pose inference runs per person on the ROI crop, in parallel, so cost
+    # grows with the number of people rather than with full-frame passes.
+    def __init__(self, pose_factory, detector=None, detect_every=15, max_people=6,
+                 max_missed=10, roi_margin=0.25, workers=None, rules=None, pose_library=None):
+        self.pose_factory = pose_factory
+        self.rules = rules
+        self.pose_library = pose_library
+        self.detector = detector or HogPersonDetector()
+        self.detect_every = detect_every
+        self.max_people = max_people
+        self.max_missed = max_missed
+        self.roi_margin = roi_margin
+        self.people = []
+        self.frame_index = 0
+        self.metrics = None
+        self._size = None
+        self._ids = itertools.count()
+        self._spare_poses = []
+        self._pool = ThreadPoolExecutor(max_workers=workers or max_people, thread_name_prefix="pose-person")
+
+    def process(self, rgb, timestamp=None):
+        t = time.monotonic() if timestamp is None else timestamp
+        h, w = rgb.shape[:2]
+        if self._size is not None and self._size != (w, h):
+            # The inference resolution changed (quality auto-tuning): keep
+            # each box on the same person.
+            sx, sy = w / self._size[0], h / self._size[1]
+            for person in self.people:
+                person.box = person.box * np.array([sx, sy, sx, sy], np.float32)
+        self._size = (w, h)
+        if not self.people or self.frame_index % self.detect_every == 0:
+            self._detect(rgb)
+        self.frame_index += 1
+        list(self._pool.map(lambda p: self._infer(p, rgb, w, h, t), self.people))
+        for person in self.people:
+            person.age += 1
+            if person.pose_frame is None:
+                person.missed += 1
+        for person in [p for p in self.people if p.missed > self.max_missed]:
+            self._drop(person)
+        self._suppress_duplicates()
+        # (person, pose_frame) pairs: the pose frame is captured here because
+        # the person object moves on to the next frame before this one is drawn.
+        return [(p, p.pose_frame) for p in self.people if p.pose_frame is not None]
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        for person in list(self.people):
+            self._drop(person)
+        for pose in self._spare_poses:
+            pose.close()
+        self._spare_poses = []
+
+    def _detect(self, rgb):
+        if self.metrics is not None:
+            with self.metrics.time("detect"):
+                boxes = self.detector(rgb)
+        else:
+            boxes = self.detector(rgb)
+        boxes = np.asarray(boxes, np.float32).reshape(-1, 4)
+        unmatched = set(range(len(boxes)))
+        if self.people and len(boxes):
+            iou = box_iou([p.box for p in self.people], boxes)
+            matched = set()
+            # Greedy matching, best overlap first.
+            for flat in np.argsort(-iou, axis=None):
+                ti, di = np.unravel_index(flat, iou.shape)
+                if iou[ti, di] < 0.2:
+                    break
+                if ti in matched or di not in unmatched:
+                    continue
+                matched.add(ti)
+                unmatched.discard(di)
+                person = self.people[ti]
+                if person.missed:
+                    person.box = boxes[di]
+        for di in sorted(unmatched):
+            if len(self.people) >= self.max_people:
+                break
+            if self._spare_poses:
+                # Forget the previous owner's tracking state, or the graph
+                # would start from their landmarks.
+                pose = self._spare_poses.pop()
+                pose.reset()
+            else:
+                pose = self.pose_factory()
+            self.people.append(TrackedPerson(next(self._ids), boxes[di], pose, self.rules, self.pose_library))
+
+    def _infer(self, person, rgb, w, h, t):
+        x0, y0, x1, y1 = self._roi(person.box, w, h)
+        if x1 - x0 < 16 or y1 - y0 < 16:
+            person.pose_frame = None
+            return
+        crop = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+        pose_frame = PoseFrame.from_results(person.pose.process(crop))
+        if pose_frame is None:
+            person.pose_frame = None
+            return
+        # Crop-normalized -> frame-normalized coordinates.
+        cw, ch = x1 - x0, y1 - y0
+        data = pose_frame.data
+        data[:, 0] = (x0 + data[:, 0] * cw) / w
+        data[:, 1] = (y0 + data[:, 1] * ch) / h
+        data[:, 2] *= cw / w
+        person.pose_frame = person.smoother.update(pose_frame, t)
+        person.missed = 0
+        visible = data[data[:, 3] > 0.5]
+        if len(visible) >= 4:
+            person.box = np.array([
+                visible[:, 0].min() * w, visible[:, 1].min() * h,
+                visible[:, 0].max() * w, visible[:, 1].max() * h,
+            ], np.float32)
+
+    def _roi(self, box, w, h):
+        x0, y0, x1, y1 = box
+        mx = (x1 - x0) * self.roi_margin
+        my = (y1 - y0) * self.roi_margin
+        return (
+            int(max(0, x0 - mx)), int(max(0, y0 - my)),
+            int(min(w, x1 + mx)), int(min(h, y1 + my)),
+        )
+
+    def _suppress_duplicates(self):
+        # Two tracks that converged on the same body: keep the older one.
+        if len(self.people) < 2:
+            return
+        iou = box_iou([p.box for p in self.people], [p.box for p in self.people])
+        np.fill_diagonal(iou, 0)
+        order = sorted(range(len(self.people)), key=lambda i: -self.people[i].age)
+        dropped = set()
+        for i in order:
+            if i in dropped:
+                continue
+            for j in np.nonzero(iou[i] > 0.6)[0]:
+                if j not in dropped and self.people[j].age <= self.people[i].age:
+                    dropped.add(int(j))
+        for j in sorted(dropped, reverse=True):
+            self._drop(self.people[j])
+
+    def _drop(self, person):
+        self.people.remove(person)
+        self._spare_poses.append(person.pose)
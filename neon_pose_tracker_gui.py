@@ -1,78 +1,100 @@
+import time
+_STARTED = time.perf_counter()  # before the heavy imports, for the startup report
+import os
 import sys
+import threading
 import cv2
-import time
-import numpy as np
-import mediapipe as mp
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QPushButton, QLabel, QVBoxLayout, QFileDialog, QComboBox, QHBoxLayout
 )
-from PyQt5.QtGui import QImage, QPixmap, QColor, QPalette
-from PyQt5.QtCore import QTimer, Qt
-from threading import Thread
-import imageio
-import pygame
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
-import csv
-import pyttsx3
-import threading
-import webbrowser
-
-mp_pose = mp.solutions.pose
-mp_hands = mp.solutions.hands
-
-class Live3DPlot:
-    def __init__(self):
-        self.coords = []
-        self.running = True
-        self.paused = False
-        self.thread = Thread(target=self.run, daemon=True)
-        self.thread.start()
-
-    def update(self, coords):
-        if not self.paused:
-            self.coords = coords
-
-    def run(self):
-        fig = plt.figure()
-        ax = fig.add_subplot(111, projection='3d')
-        plt.ion()
-        while self.running:
-            if self.coords and not self.paused:
-                ax.cla()
-                x, y, z = zip(*self.coords)
-                ax.scatter(x, y, z, c='cyan', s=40)
-                ax.plot(x, y, z, color='magenta')
-                ax.set_xlim(0, 1)
-                ax.set_ylim(0, 1)
-                ax.set_zlim(-0.5, 0.5)
-                ax.view_init(elev=10., azim=135)
-                fig.canvas.draw()
-                fig.canvas.flush_events()
-            time.sleep(0.05)
-
-    def pause(self):
-        self.paused = True
-
-    def resume(self):
-        self.paused = False
-
-    def clear(self):
-        self.coords = []
+from PyQt5.QtGui import QImage, QColor, QPainter, QPalette
+from PyQt5.QtCore import QRect, QSize, QTimer, Qt
+
+from frame_sources import CameraSource, count_cameras, open_source
+from audio import ALERT, FEEDBACK, FLOW, MusicService, NarrationService
+from landmark_filter import MotionGate, PoseSmoother
+from landmark_store import LandmarkStore, LandmarkWriter
+from multi_person import MultiPersonTracker
+from pose_inference import GraphCache, InferenceScheduler, ModelLoader
+from pose_analysis import PoseAnalyzer, analyze_people
+from pose_library import PoseLibrary
+from pose_landmarks import NOSE, HandFrame, PoseFrame, draw_hands, draw_pose
+from pose_metrics import MetricsServer, StageMetrics, StartupTimer
+from pose_pipeline import FrameEngine
+from pose_rules import load_rules
+from quality_control import QUALITY_LEVELS, QualityController, hands_options, level_index, pose_options
+from recording import GifCapture, VideoRecorder
+from session_store import SessionRecorder
+
+class FrameView(QWidget):
+    # Paints frames straight from their numpy buffers: the QImage wraps the
+    # array without copying and there is no QPixmap conversion. Holding
+    # the frame also keeps the engine's buffer pool from reusing it while
+    # it is on screen.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.frame = None
+        self.image = None
+        self.setMinimumSize(320, 240)
+
+    def set_frame(self, frame):
+        resized = self.frame is None or self.frame.shape != frame.shape
+        self.frame = frame
+        self.image = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_BGR888)
+        if resized:
+            self.updateGeometry()
+        self.update()
+
+    def sizeHint(self):
+        if self.frame is None:
+            return QSize(640, 480)
+        return QSize(self.frame.shape[1], self.frame.shape[0])
+
+    def paintEvent(self, event):
+        if self.image is None:
+            return
+        size = self.image.size().scaled(self.size(), Qt.KeepAspectRatio)
+        target = QRect((self.width() - size.width()) // 2, (self.height() - size.height()) // 2,
+                       size.width(), size.height())
+        painter = QPainter(self)
+        painter.drawImage(target, self.image)
+        painter.end()
+
 
 class NeonPoseApp(QWidget):
-    def __init__(self):
+    def __init__(self, source=None, startup=None):
+        init_started = time.perf_counter()
         super().__init__()
+        # MediaPipe is imported and both graphs are built and warmed up on a
+        # background thread while the window comes up; frames show untracked
+        # until they are ready.
+        self.startup = startup or StartupTimer()
+        # Quality auto-tuning: input resolution, model complexity, hands and
+        # plot cadence follow a frame-rate budget of NEON_POSE_TARGET_FPS
+        # (default 25). 0 keeps the "high" settings fixed.
+        target_fps = float(os.environ.get("NEON_POSE_TARGET_FPS", 25))
+        self.quality = QualityController(target_fps) if target_fps > 0 else None
+        if self.quality is not None:
+            self.quality_level = self.quality.level
+        else:
+            self.quality_level = QUALITY_LEVELS[level_index("high")]
+        self.graphs = None  # GraphCache, once mediapipe is loaded
+        self.loader = ModelLoader(
+            pose_options(self.quality_level), hands_options(self.quality_level), timer=self.startup
+        ).start()
+        self.models_ready = False
+        self._startup_reported = False
         self.setWindowTitle("Neon Pose Tracker")
         self.setGeometry(100, 100, 800, 600)
 
-        self.video_label = QLabel(self)
+        self.video_label = FrameView(self)
         self.record_btn = QPushButton("Start Recording")
-        self.gif_btn = QPushButton("Export GIF")
+        self.gif_btn = QPushButton("Start GIF Capture")
         self.music_btn = QPushButton("Play Music")
         self.screenshot_btn = QPushButton("Screenshot")  # Feature 1
         self.export_csv_btn = QPushButton("Export CSV")  # Feature 3
         self.theme_btn = QPushButton("Toggle Theme")     # Feature 6
+        self.multi_person_btn = QPushButton("Multi-Person: Off")
 
         # Camera selection (Feature 4)
         self.camera_combo = QComboBox()
@@ -90,7 +112,16 @@ class NeonPoseApp(QWidget):
         self.feedback_label.setStyleSheet("font-size: 18px; color: green;")
 
         # 2. Repetition/Exercise Counter
-        self.rep_count = 0
+        # Pose checks, reminders and flows come from pose_rules.json, or
+        # from the file named by NEON_POSE_RULES.
+        self.rules = load_rules(os.environ.get("NEON_POSE_RULES"))
+        # Custom pose alerts match against every pose saved so far.
+        self.pose_library_path = 'custom_poses.npy'
+        if os.path.exists(self.pose_library_path):
+            self.pose_library = PoseLibrary.load(self.pose_library_path)
+        else:
+            self.pose_library = PoseLibrary()
+        self.analyzer = PoseAnalyzer(self.rules, self.pose_library)
         self.rep_label = QLabel("Reps: 0")
         self.rep_label.setAlignment(Qt.AlignCenter)
         self.rep_label.setStyleSheet("font-size: 18px; color: blue;")
@@ -115,6 +146,7 @@ class NeonPoseApp(QWidget):
         btn_layout.addWidget(self.screenshot_btn)
         btn_layout.addWidget(self.export_csv_btn)
         btn_layout.addWidget(self.theme_btn)
+        btn_layout.addWidget(self.multi_person_btn)
 
         plot_layout = QHBoxLayout()
         plot_layout.addWidget(self.plot_pause_btn)
@@ -133,27 +165,99 @@ class NeonPoseApp(QWidget):
         layout.addWidget(self.share_btn)
         self.setLayout(layout)
 
-        self.cap = cv2.VideoCapture(0)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.pose = mp_pose.Pose()
-        self.hands = mp_hands.Hands()
+        # Any frame source works here (camera, video file, image folder,
+        # synthetic pattern, frame cache); the default is the first webcam,
+        # opened in the background once the engine is running.
+        self.cap = source
+        self.pose = None
+        self.hands = None
         self.recording = False
-        self.frames = []
-        self.video_writer = None
-        self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.gif_capture = None
+        self.gif_window = 5.0  # seconds kept for GIF export
+        self.recorder = None
+        self.raw_recorder = None
         self.output_file = 'recorded_session.mp4'
-        self.landmark_data = []  # For CSV export
+        self.record_codec = 'mp4v'
+        self.record_fps = None  # None: measured from the incoming frames
+        self.record_raw = False  # also save the un-annotated camera stream
+        # Last minute of landmarks at 30 fps; older frames are only kept on
+        # disk while an export is streaming.
+        self.landmark_store = LandmarkStore(capacity=1800)
+        self.landmark_writer = None
+        # Every run's landmarks, rule and rep events and flow progress go to
+        # the session store in NEON_POSE_SESSIONS (default "sessions", empty
+        # turns it off); query it with session_store.py.
+        sessions_root = os.environ.get("NEON_POSE_SESSIONS", "sessions")
+        self.session = None
+        if sessions_root:
+            try:
+                self.session = SessionRecorder(sessions_root)
+            except OSError as e:
+                # e.g. a read-only working directory: run without the store.
+                print("Session Store Error:", e)
+                self.feedback_label.setText(f"Session recording off: {e}")
 
-        pygame.mixer.init()
+        self.music = None  # started on first use
         self.music_playing = False
         self.music_path = 'background.mp3'  # ensure this file exists
 
-        self.plot3d = Live3DPlot()
+        # The 3D view (and matplotlib with it) is set up right after the
+        # window first shows.
+        self.plot3d = None
+        self.plot_canvas = None
+        self.plot_timer = None
+        QTimer.singleShot(0, self.init_plot)
+
+        self.fps_time = 0
+        self.current_frame = None
+        self.last_packet = None
+        self.last_pose_frame = None
+        # The flow pose the render thread checks, or None outside a flow.
+        # Set in one assignment by the GUI thread, so the render thread
+        # never sees the flow half-advanced.
+        self.flow_pose = None
+        self.rep_text = "Reps: 0"
+        self.tracker = None
+
+        # Capture, inference and drawing run on the engine's worker threads;
+        # the timer below only picks up the latest finished frame.
+        # Hands run every other frame, only when a wrist is in view, in
+        # parallel with pose. Neither runs while the picture is still;
+        # landmarks are smoothed over time so jitter can't count reps.
+        self.scheduler = InferenceScheduler(
+            self.pose, self.hands, hands_every=self.quality_level["hands_every"], gate_hands=True,
+            motion_gate=MotionGate(),
+        )
+        self.metrics = StageMetrics()
+        self.engine = FrameEngine(self.cap, render=self.process_frame, scheduler=self.scheduler, metrics=self.metrics)
+        self.engine.smoother = PoseSmoother()
+        self.engine.input_scale = self.quality_level["input_scale"]
+        if self.quality is not None:
+            self.engine.quality = self.quality
+            self.quality.on_change.append(self.apply_quality)
+        # Per-stage latency percentiles at http://127.0.0.1:<port>/metrics when
+        # NEON_POSE_METRICS_PORT is set.
+        self.metrics_server = None
+        if os.environ.get("NEON_POSE_METRICS_PORT"):
+            self.metrics_server = MetricsServer(
+                self.metrics, port=int(os.environ["NEON_POSE_METRICS_PORT"]), extra=self.engine.stats
+            )
+        # Annotated video (MJPEG) and landmark events (WebSocket / SSE) for
+        # other programs on the network when NEON_POSE_STREAM_PORT is set.
+        self.stream_server = None
+        if os.environ.get("NEON_POSE_STREAM_PORT"):
+            from streaming import StreamServer
+
+            self.stream_server = StreamServer(
+                int(os.environ["NEON_POSE_STREAM_PORT"]),
+                host=os.environ.get("NEON_POSE_STREAM_HOST", "127.0.0.1"),
+                metrics=self.metrics,
+            )
+        self.engine.add_sink(self.write_outputs)
 
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)
+        self.timer.start(min(30, int(1000 / target_fps)) if target_fps > 0 else 30)
 
         self.record_btn.clicked.connect(self.toggle_recording)
         self.gif_btn.clicked.connect(self.export_gif)
@@ -161,108 +265,229 @@ class NeonPoseApp(QWidget):
         self.screenshot_btn.clicked.connect(self.save_screenshot)  # Feature 1
         self.export_csv_btn.clicked.connect(self.export_csv)        # Feature 3
         self.theme_btn.clicked.connect(self.toggle_theme)           # Feature 6
+        self.multi_person_btn.clicked.connect(self.toggle_multi_person)
 
-        self.plot_pause_btn.clicked.connect(self.plot3d.pause)      # Feature 5
-        self.plot_resume_btn.clicked.connect(self.plot3d.resume)    # Feature 5
-        self.plot_clear_btn.clicked.connect(self.plot3d.clear)      # Feature 5
-
-        self.fps_time = 0
-        self.current_frame = None
         self.dark_theme = False
 
-        self.narrator_engine = pyttsx3.init()
-        self.last_narration = ""
-        self.narrate_enabled = True  # Toggle for narration
+        # Speech runs on one worker thread with a small priority queue:
+        # alerts cut off commentary, commentary is rate-limited.
+        self.narrator = NarrationService()
         # Add a button to toggle narration if you want:
         # self.narrate_btn = QPushButton("Toggle Narration")
         # self.narrate_btn.clicked.connect(self.toggle_narration)
         # layout.addWidget(self.narrate_btn)
 
         # Yoga Flow
-        self.yoga_flow = [
-            {"name": "T-Pose", "duration": 8, "instruction": "Stand straight with both arms stretched out horizontally."},
-            {"name": "Hands Up", "duration": 8, "instruction": "Raise both hands above your head and stand straight."},
-        ]
+        self.yoga_flow = self.rules.flows.get("yoga", [])
         self.current_pose_idx = 0
         self.pose_hold_time = 0
-        self.in_pose = False
         self.yoga_timer = QTimer()
         self.yoga_timer.timeout.connect(self.next_yoga_pose)
 
         # Add Yoga Flow button
         self.yoga_btn = QPushButton("Start Yoga Flow")
         self.yoga_btn.clicked.connect(self.start_yoga_flow)
+        # A rules file without a "yoga" flow has nothing to start.
+        self.yoga_btn.setEnabled(bool(self.yoga_flow))
         self.layout().addWidget(self.yoga_btn)
 
-        self.custom_pose_landmarks = None
+        self.engine.start()
+        if source is None:
+            self.open_camera(0)
+        self.startup.record("window setup", init_started)
+
+    def init_plot(self):
+        # The 3D view lives in the window and redraws on its own, slower
+        # timer, only when a new pose has come in.
+        with self.startup.phase("3D plot"):
+            from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+            from pose_plot3d import Live3DPlot
+
+            plot3d = Live3DPlot(interval_ms=self.quality_level["plot_interval_ms"])
+            self.plot_canvas = FigureCanvasQTAgg(plot3d.figure)
+            self.plot_canvas.setMinimumHeight(240)
+            self.layout().insertWidget(1, self.plot_canvas)
+            self.plot_timer = QTimer()
+            self.plot_timer.timeout.connect(plot3d.redraw)
+            self.plot_timer.start(plot3d.interval_ms)
+            self.plot_pause_btn.clicked.connect(plot3d.pause)      # Feature 5
+            self.plot_resume_btn.clicked.connect(plot3d.resume)    # Feature 5
+            self.plot_clear_btn.clicked.connect(plot3d.clear)      # Feature 5
+            self.plot3d = plot3d
+
+    def open_camera(self, idx):
+        # Opening a camera can take a second or more; do it off the GUI thread.
+        def run():
+            with self.startup.phase(f"open camera {idx}"):
+                cap = CameraSource(idx, 640, 480)
+            self.cap = cap
+            self.engine.set_source(cap)
+
+        threading.Thread(target=run, name="camera-open", daemon=True).start()
+
+    def install_models(self):
+        # GUI thread, once the loader has finished.
+        self.models_ready = True
+        if self.loader.error is not None:
+            self.feedback_label.setText(f"Could not load pose models: {self.loader.error}")
+            return
+        self.pose = self.loader.pose
+        self.hands = self.loader.hands
+        self.scheduler.hands = self.hands
+        if self.tracker is None:
+            self.scheduler.pose = self.pose
+        self.graphs = GraphCache(self.loader.mp)
+        self.graphs.put("pose", self.loader.pose_options, self.pose)
+        if self.hands is not None:
+            self.graphs.put("hands", self.loader.hands_options, self.hands)
+        # The level may have changed while the models were loading.
+        self.request_graphs(self.quality_level)
+        self.startup.mark("models installed")
+
+    def apply_quality(self, level):
+        # Render thread, when the quality controller changes level. Graphs
+        # for new model settings are built in the background and swapped in
+        # when ready; update_frame picks up the plot interval.
+        self.quality_level = level
+        self.engine.input_scale = level["input_scale"]
+        self.scheduler.hands_every = level["hands_every"]
+        self.request_graphs(level)
+
+    def request_graphs(self, level):
+        graphs = self.graphs
+        if graphs is None:
+            return  # still loading; install_models catches up
+        graphs.request("pose", pose_options(level), self.install_graph)
+        if self.hands is not None:
+            graphs.request("hands", hands_options(level), self.install_graph)
+
+    def install_graph(self, kind, options, graph):
+        # Builder thread (or the caller's, when cached). Graphs that the
+        # level has moved past while building are kept in the cache only.
+        # A cached graph still tracks whatever it saw last time it was in
+        # use, so it starts over; the graph in use is never reset.
+        level = self.quality_level
+        if graph is None:
+            return
+        if kind == "pose" and options == pose_options(level):
+            if graph is not self.pose:
+                graph.reset()
+            self.pose = graph
+            if self.tracker is None:
+                self.scheduler.pose = graph
+        elif kind == "hands" and options == hands_options(level):
+            if graph is not self.hands:
+                graph.reset()
+            self.hands = graph
+            self.scheduler.hands = graph
 
     def get_camera_count(self):
-        count = 0
-        for i in range(2):  # Only check 0 and 1
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                count += 1
-                cap.release()
+        count = count_cameras(2)  # Only check 0 and 1
         return count if count > 0 else 1
 
     def change_camera(self, idx):
-        if self.cap.isOpened():
-            self.cap.release()
-        self.cap = cv2.VideoCapture(idx)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+        self.open_camera(idx)
 
     def toggle_recording(self):
         self.recording = not self.recording
         if self.recording:
-            self.video_writer = cv2.VideoWriter(self.output_file, self.fourcc, 20.0, (640, 480))
+            self.recorder = VideoRecorder(
+                self.output_file, codec=self.record_codec, fps=self.record_fps, metrics=self.metrics
+            )
+            if self.record_raw:
+                base, ext = os.path.splitext(self.output_file)
+                self.raw_recorder = VideoRecorder(f"{base}_raw{ext}", codec=self.record_codec, fps=self.record_fps)
+                self.engine.keep_raw = True
             self.record_btn.setText("Stop Recording")
         else:
-            self.video_writer.release()
-            self.video_writer = None
+            stats = self.stop_recording()
             self.record_btn.setText("Start Recording")
+            if stats['error'] is not None:
+                self.feedback_label.setText(f"Recording failed: {stats['error']}")
+            else:
+                self.feedback_label.setText(
+                    f"Saved {self.output_file}: {stats['frames_written']} frames, {stats['dropped']} dropped"
+                )
+
+    def stop_recording(self):
+        recorder, raw_recorder = self.recorder, self.raw_recorder
+        self.recorder = self.raw_recorder = None
+        self.engine.keep_raw = False
+        if raw_recorder is not None:
+            raw_recorder.close(wait=False)
+        if recorder is None:
+            return None
+        # Encoding happens on the recorder thread; this only waits for its
+        # queue (a couple of seconds of frames at most) to drain.
+        recorder.close()
+        return recorder.stats()
 
     def toggle_music(self):
+        if self.music is None:
+            self.music = MusicService()
         if self.music_playing:
-            pygame.mixer.music.stop()
+            self.music.stop()
             self.music_btn.setText("Play Music")
         else:
-            try:
-                pygame.mixer.music.load(self.music_path)
-                pygame.mixer.music.play(-1)
-                self.music_btn.setText("Stop Music")
-            except Exception as e:
-                print("Music Error:", e)
+            self.music.play(self.music_path)
+            self.music_btn.setText("Stop Music")
         self.music_playing = not self.music_playing
 
     def export_gif(self):
-        if not self.frames:
+        # First click starts keeping a rolling window of frames, the second
+        # writes that window out in the background.
+        if self.gif_capture is None:
+            self.gif_capture = GifCapture(window=self.gif_window)
+            self.gif_btn.setText("Export GIF")
+            return
+        if not len(self.gif_capture):
             return
         path, _ = QFileDialog.getSaveFileName(self, "Save GIF", "pose.gif", "GIF Files (*.gif)")
         if path:
-            imageio.mimsave(path, self.frames, duration=0.1)
-            self.frames.clear()
+            self.gif_capture.export(path)
+            self.gif_capture = None
+            self.gif_btn.setText("Start GIF Capture")
 
     def save_screenshot(self):
-        if self.current_frame is not None:
+        # Holding the reference pins the frame on screen now; the engine
+        # won't recycle it while the dialog is open, so no copy is needed.
+        frame = self.current_frame
+        if frame is not None:
             path, _ = QFileDialog.getSaveFileName(self, "Save Screenshot", "screenshot.png", "PNG Files (*.png)")
             if path:
-                cv2.imwrite(path, self.current_frame)
+                cv2.imwrite(path, frame)
     # Feature 1
 
     def export_csv(self):
-        if not self.landmark_data:
+        # Starts streaming the buffered and all following landmarks to disk;
+        # a second click finishes the file.
+        if self.landmark_writer is not None:
+            self.stop_export()
             return
-        path, _ = QFileDialog.getSaveFileName(self, "Export CSV", "landmarks.csv", "CSV Files (*.csv)")
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Landmarks", "landmarks.csv",
+            "CSV Files (*.csv);;NumPy Chunks (*.npz);;Parquet Files (*.parquet)"
+        )
         if path:
-            with open(path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['frame', 'landmark_id', 'x', 'y', 'z'])
-                for row in self.landmark_data:
-                    writer.writerow(row)
-            self.landmark_data.clear()
+            try:
+                self.landmark_writer = LandmarkWriter(path)
+            except (ValueError, ImportError) as e:
+                self.feedback_label.setText(str(e))
+                return
+            self.landmark_store.attach_writer(self.landmark_writer)
+            self.export_csv_btn.setText("Stop Export")
     # Feature 3
 
+    def stop_export(self):
+        writer, self.landmark_writer = self.landmark_writer, None
+        self.landmark_store.detach_writer()
+        writer.close(wait=False)
+        self.export_csv_btn.setText("Export CSV")
+        if writer.error is not None:
+            self.feedback_label.setText(f"Landmark export failed: {writer.error}")
+        elif writer.chunks_dropped:
+            self.feedback_label.setText(f"Landmark export: {writer.chunks_dropped} chunks dropped (disk too slow)")
+
     def toggle_theme(self):
         if self.dark_theme:
             self.setStyleSheet("")
@@ -280,51 +505,98 @@ class NeonPoseApp(QWidget):
             self.dark_theme = True
     # Feature 6
 
-    def narrate(self, text):
-        if self.narrate_enabled and text and text != self.last_narration:
-            threading.Thread(target=self._speak, args=(text,), daemon=True).start()
-            self.last_narration = text
-
-    def _speak(self, text):
-        self.narrator_engine.say(text)
-        self.narrator_engine.runAndWait()
+    def narrate(self, text, priority=ALERT, key=None):
+        # Safe from any thread: only queues the text.
+        self.narrator.say(text, priority, key)
 
     # Optional: to toggle narration on/off
     # def toggle_narration(self):
-    #     self.narrate_enabled = not self.narrate_enabled
+    #     self.narrator.enabled = not self.narrator.enabled
 
     def start_yoga_flow(self):
+        if not self.yoga_flow:
+            return
         self.current_pose_idx = 0
         self.pose_hold_time = 0
-        self.in_pose = False
+        self.analyzer.in_pose = False
+        if self.tracker is not None:
+            for person in list(self.tracker.people):
+                person.analyzer.in_pose = False
         self.yoga_btn.setEnabled(False)
-        self.narrate(f"Let's begin! First pose: {self.yoga_flow[0]['name']}. {self.yoga_flow[0]['instruction']}")
+        self.flow_pose = self.yoga_flow[0]['name']
+        self.record_flow_event("flow_start", self.yoga_flow[0]['name'])
+        self.narrate(
+            f"Let's begin! First pose: {self.yoga_flow[0]['name']}. {self.yoga_flow[0]['instruction']}", FLOW, "flow"
+        )
         self.feedback_label.setText(f"Yoga Flow: {self.yoga_flow[0]['name']}")
         self.yoga_timer.start(self.yoga_flow[0]['duration'] * 1000)
 
     def next_yoga_pose(self):
         self.current_pose_idx += 1
         if self.current_pose_idx >= len(self.yoga_flow):
-            self.narrate("Yoga flow complete. Great job!")
+            self.flow_pose = None
+            self.record_flow_event("flow_complete", "yoga")
+            self.narrate("Yoga flow complete. Great job!", FLOW, "flow")
             self.feedback_label.setText("Yoga flow complete!")
             self.yoga_btn.setEnabled(True)
             self.yoga_timer.stop()
             return
         pose = self.yoga_flow[self.current_pose_idx]
-        self.narrate(f"Next pose: {pose['name']}. {pose['instruction']}")
+        self.flow_pose = pose['name']
+        self.record_flow_event("flow_step", pose['name'])
+        self.narrate(f"Next pose: {pose['name']}. {pose['instruction']}", FLOW, "flow")
         self.feedback_label.setText(f"Yoga Flow: {pose['name']}")
         self.yoga_timer.start(pose['duration'] * 1000)
 
+    def record_flow_event(self, kind, label):
+        # Stamped on the frame clock (media time for replays), like the
+        # rule events.
+        if self.session is not None:
+            packet = self.last_packet
+            timestamp = packet.timestamp if packet is not None else time.time()
+            self.session.add_event(timestamp, kind, label, packet.index if packet is not None else -1)
+
+    def toggle_multi_person(self):
+        # Multi-person mode replaces the single full-frame pose graph with a
+        # detector plus one ROI pose graph per person; each person gets their
+        # own rep counter and posture state.
+        if self.tracker is None:
+            mp = self.loader.mp
+            if mp is None:
+                self.feedback_label.setText("Pose models are still loading.")
+                return
+            self.tracker = MultiPersonTracker(
+                lambda: mp.solutions.pose.Pose(**pose_options(self.quality_level)),
+                detect_every=15, rules=self.rules, pose_library=self.pose_library,
+            )
+            self.tracker.metrics = self.metrics
+            self.scheduler.pose = None
+            self.scheduler.last_pose = None
+            self.engine.set_tracker(self.tracker)
+            self.multi_person_btn.setText("Multi-Person: On")
+        else:
+            self.tracker = None
+            self.engine.set_tracker(None)
+            self.scheduler.pose = self.pose
+            self.multi_person_btn.setText("Multi-Person: Off")
+
     def set_custom_pose(self):
-        # Save current pose as custom alert pose
-        if hasattr(self, 'last_pose_landmarks') and self.last_pose_landmarks is not None:
-            self.custom_pose_landmarks = [(lm.x, lm.y, lm.z) for lm in self.last_pose_landmarks]
-            self.narrate("Custom pose alert set.")
-            self.feedback_label.setText("Custom pose alert set!")
+        # Add the current pose to the custom pose library
+        if self.last_pose_frame is not None:
+            name = f"Pose {len(self.pose_library) + 1}"
+            self.pose_library.add(name, self.last_pose_frame.data)
+            self.pose_library.save(self.pose_library_path)
+            self.narrate(f"Custom pose alert set: {name}.")
+            self.feedback_label.setText(f"Custom pose alert set: {name}!")
         else:
             self.feedback_label.setText("No pose detected to set as custom alert.")
 
     def show_obs_hint(self):
+        if self.stream_server is not None:
+            # OBS can take the built-in stream directly as a Media Source.
+            port = self.stream_server.port
+            self.feedback_label.setText(f"Streaming at http://localhost:{port}/stream.mjpg")
+            return
         msg = (
             "To stream your pose-tracked video live:\n"
             "1. Install OBS Studio and the OBS Virtual Camera plugin.\n"
@@ -333,172 +605,193 @@ class NeonPoseApp(QWidget):
             "4. Select 'OBS Virtual Camera' as your webcam in Zoom, Teams, or browser.\n"
             "Learn more: https://obsproject.com/"
         )
+        import webbrowser
+
         webbrowser.open("https://obsproject.com/")
         self.feedback_label.setText("Opened OBS instructions in your browser.")
 
     def share_session(self):
         # For demo: open Twitter share with a message
         url = "https://twitter.com/intent/tweet?text=I+just+completed+a+yoga+session+with+Neon+Pose+Tracker!+%23YogaAI"
+        import webbrowser
+
         webbrowser.open(url)
         self.feedback_label.setText("Share your session on social media!")
 
-    def update_frame(self):
-        ret, frame = self.cap.read()
-        if not ret:
-            return
-
-        frame = cv2.flip(frame, 1)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pose_results = self.pose.process(rgb_frame)
-        hands_results = self.hands.process(rgb_frame)
-
-        h, w, _ = frame.shape
-        coords_for_3d = []
-        landmarks_this_frame = []
+    def process_frame(self, packet):
+        # Runs on the engine's render thread: no Qt widget calls in here.
+        frame = packet.frame
+        if self.engine.smoother is not None:
+            pose_frame = packet.pose_frame
+        else:
+            pose_frame = PoseFrame.from_results(packet.pose_results)
+        hand_frame = HandFrame.from_results(packet.hands_results)
+        packet.pose_frame = pose_frame
+        packet.hand_frame = hand_frame
 
         feedback = ""
         person_colors = [(255,0,0), (0,255,0), (0,0,255), (255,255,0), (255,0,255)]
         person_id = 0
-        pose_correct = False
+
+        pose_name = self.flow_pose
+
+        if packet.people is not None:
+            # Multi-person mode: the first tracked person stands in for the
+            # custom pose, the landmark store and the 3D view.
+            pose_frame = packet.people[0][1] if packet.people else None
+            feedback = self.process_people(packet, pose_name, person_colors)
+            if pose_frame is not None:
+                self.landmark_store.append(packet.index, packet.timestamp, pose_frame.data)
 
         # Save last pose landmarks for custom pose alert
-        self.last_pose_landmarks = pose_results.pose_landmarks.landmark if pose_results.pose_landmarks else None
+        self.last_pose_frame = pose_frame
 
-        if pose_results.pose_landmarks:
+        if pose_frame is not None and packet.people is None:
             color = person_colors[person_id % len(person_colors)]
-            for idx, lm in enumerate(pose_results.pose_landmarks.landmark):
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                cz = lm.z
-                coords_for_3d.append((lm.x, lm.y, cz))
-                cv2.circle(frame, (cx, cy), 5, color, -1)
-                landmarks_this_frame.append([len(self.landmark_data), idx, lm.x, lm.y, cz])
-            skeleton_pairs = [
-                (11,13), (13,15), (12,14), (14,16),
-                (11,12), (23,24),
-                (23,25), (25,27), (24,26), (26,28),
-                (27,31), (28,32)
-            ]
-            for a, b in skeleton_pairs:
-                pt1 = pose_results.pose_landmarks.landmark[a]
-                pt2 = pose_results.pose_landmarks.landmark[b]
-                x1, y1 = int(pt1.x * w), int(pt1.y * h)
-                x2, y2 = int(pt2.x * w), int(pt2.y * h)
-                cv2.line(frame, (x1, y1), (x2, y2), color, 2)
-
-            left_shoulder = pose_results.pose_landmarks.landmark[11]
-            right_shoulder = pose_results.pose_landmarks.landmark[12]
-            left_wrist = pose_results.pose_landmarks.landmark[15]
-            right_wrist = pose_results.pose_landmarks.landmark[16]
-            left_hip = pose_results.pose_landmarks.landmark[23]
-            right_hip = pose_results.pose_landmarks.landmark[24]
-
-            # 2. Repetition/Exercise Counter (example: count "hands up" reps)
-            if not hasattr(self, 'last_hands_up'):
-                self.last_hands_up = False
-            hands_up = left_wrist.y < left_shoulder.y and right_wrist.y < right_shoulder.y
-            if hands_up and not self.last_hands_up:
-                self.rep_count += 1
-                self.rep_label.setText(f"Reps: {self.rep_count}")
-            self.last_hands_up = hands_up
-
-            # 3. Custom Pose Alerts (simple Euclidean distance check)
-            if self.custom_pose_landmarks is not None:
-                dist = np.mean([
-                    np.linalg.norm(np.array([lm.x, lm.y, lm.z]) - np.array(ref))
-                    for lm, ref in zip(pose_results.pose_landmarks.landmark, self.custom_pose_landmarks)
-                ])
-                if dist < 0.08:
-                    feedback += "Custom pose matched! "
-                    self.narrate("Custom pose matched!")
-
-            # 9. Posture Reminder (example: slouching detection)
-            if abs(left_shoulder.y - right_shoulder.y) > 0.15:
-                self.bad_posture_frames += 1
-                if self.bad_posture_frames > self.posture_reminder_threshold:
-                    feedback += "Please correct your posture!"
-                    self.narrate("Please correct your posture!")
-                    self.bad_posture_frames = 0
-            else:
-                self.bad_posture_frames = 0
-
-            # --- Yoga Narrator Feedback & Pose Checking ---
-            if self.yoga_timer.isActive():
-                pose_name = self.yoga_flow[self.current_pose_idx]['name']
-                if pose_name == "T-Pose":
-                    # Arms stretched horizontally: wrists and shoulders at similar y
-                    if abs(left_wrist.y - left_shoulder.y) < 0.07 and abs(right_wrist.y - right_shoulder.y) < 0.07:
-                        feedback += "Good! Hold the T-Pose."
-                        pose_correct = True
-                    else:
-                        feedback += "Stretch both arms out horizontally."
-                elif pose_name == "Hands Up":
-                    if left_wrist.y < left_shoulder.y and right_wrist.y < right_shoulder.y:
-                        feedback += "Great! Hold hands up."
-                        pose_correct = True
-                    else:
-                        feedback += "Raise both hands above your head."
-                # Add more poses here as needed
-
-                if pose_correct and not self.in_pose:
-                    self.narrate("Pose correct. Hold it.")
-                    self.in_pose = True
-                elif not pose_correct and self.in_pose:
-                    self.narrate("Pose lost. Try again.")
-                    self.in_pose = False
-            else:
-                # Default feedback if not in yoga flow
-                if left_wrist.y < left_shoulder.y and right_wrist.y < right_shoulder.y:
-                    if abs(left_shoulder.y - right_shoulder.y) < 0.05 and abs(left_hip.y - right_hip.y) < 0.05:
-                        feedback = "Perfect: Both hands up and standing straight!"
-                    else:
-                        feedback = "Hands up! Try to stand straight."
-                elif left_wrist.y < left_shoulder.y or right_wrist.y < right_shoulder.y:
-                    feedback = "Raise both hands above shoulders."
-                else:
-                    feedback = "Try raising your hands!"
-                self.narrate(feedback)
-
-        self.landmark_data.extend(landmarks_this_frame)
-
-        if hands_results.multi_hand_landmarks:
-            for hand_landmarks in hands_results.multi_hand_landmarks:
-                for lm in hand_landmarks.landmark:
-                    cx, cy = int(lm.x * w), int(lm.y * h)
-                    cv2.circle(frame, (cx, cy), 4, (0, 255, 255), -1)
-
-        self.plot3d.update(coords_for_3d)
+            with self.metrics.time("draw"):
+                draw_pose(frame, pose_frame, color)
+            self.landmark_store.append(packet.index, packet.timestamp, pose_frame.data)
+
+            with self.metrics.time("analysis"):
+                analysis = self.analyzer.analyze(pose_frame, pose_name)
+            feedback = analysis.feedback
+            session = self.session
+            if session is not None:
+                session.add_frame(packet.index, packet.timestamp, pose_frame.data)
+                for name, value in analysis.events:
+                    session.add_event(packet.timestamp, name, value, packet.index)
+            for text in analysis.narration:
+                self.narrate(text, ALERT, "pose")
+            if pose_name is None:
+                self.narrate(feedback, FEEDBACK)
+            self.rep_text = f"Reps: {self.analyzer.rep_count}"
+
+        if hand_frame is not None:
+            with self.metrics.time("draw"):
+                draw_hands(frame, hand_frame)
+
+        plot3d = self.plot3d
+        if plot3d is not None:
+            plot3d.update(pose_frame.xyz if pose_frame is not None else None)
 
         c_time = time.time()
         fps = 1 / (c_time - self.fps_time + 1e-6)
         self.fps_time = c_time
         cv2.putText(frame, f'FPS: {int(fps)}', (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
 
-        if self.recording and self.video_writer:
-            resized = cv2.resize(frame, (640, 480))
-            self.video_writer.write(resized)
-
-        small_frame = cv2.resize(frame, (320, 240))
-        max_gif_frames = 100
-        if len(self.frames) < max_gif_frames:
-            self.frames.append(cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB))
+        packet.feedback = feedback
+
+    def process_people(self, packet, pose_name, person_colors):
+        frame, people = packet.frame, packet.people
+        session = self.session
+        h, w = frame.shape[:2]
+        feedback = []
+        reps = []
+        # Everyone's rules are scored in one batched pass.
+        with self.metrics.time("analysis"):
+            analyses = analyze_people([p.analyzer for p, _ in people], [pf for _, pf in people], pose_name)
+        for (person, pose_frame), analysis in zip(people, analyses):
+            color = person_colors[person.id % len(person_colors)]
+            with self.metrics.time("draw"):
+                draw_pose(frame, pose_frame, color)
+            x, y = pose_frame.pixels(w, h)[NOSE]
+            cv2.putText(frame, f"P{person.id}", (int(x), max(int(y) - 20, 12)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+            feedback.append(f"P{person.id}: {analysis.feedback}")
+            if session is not None:
+                session.add_frame(packet.index, packet.timestamp, pose_frame.data, person.id)
+                for name, value in analysis.events:
+                    session.add_event(packet.timestamp, name, value, packet.index, person.id)
+            reps.append(f"P{person.id} {person.analyzer.rep_count}")
+            # Only alerts are spoken per person; the running feedback of
+            # several people at once would never stop talking.
+            if any(name == "posture" for name, _ in analysis.events):
+                self.narrate(f"Person {person.id}, please correct your posture!", ALERT, f"person-{person.id}")
+        self.rep_text = "Reps: " + ", ".join(reps) if reps else "Reps: -"
+        return " | ".join(feedback)
+
+    def write_outputs(self, packet):
+        # Engine sink thread: recording and GIF capture. The recorders only
+        # queue the frame; encoding happens on their own threads.
+        frame = packet.frame
+        recorder, raw_recorder = self.recorder, self.raw_recorder
+        if recorder is not None:
+            recorder.write(frame, packet.timestamp)
+        if raw_recorder is not None and packet.raw is not None:
+            raw_recorder.write(packet.raw, packet.timestamp)
+        gif_capture = self.gif_capture
+        if gif_capture is not None:
+            gif_capture.offer(frame, packet.timestamp)
+        if self.stream_server is not None:
+            self.stream_server.publish_packet(packet, reps=self.rep_text)
 
-        img = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_BGR888)
-        self.video_label.setPixmap(QPixmap.fromImage(img))
-        self.current_frame = frame.copy()
-
-        self.feedback_label.setText(feedback)
+    def update_frame(self):
+        if not self.models_ready and self.loader.ready.is_set():
+            self.install_models()
+        writer = self.landmark_writer
+        if writer is not None and writer.error is not None:
+            self.stop_export()
+        session = self.session
+        if session is not None and session.error is not None:
+            self.session = None
+            session.close(wait=False)
+            self.feedback_label.setText(f"Session recording failed: {session.error}")
+        packet = self.engine.latest()
+        if packet is None or packet is self.last_packet:
+            return
+        if self.last_packet is None:
+            self.startup.mark("first frame shown")
+        self.last_packet = packet
+        if self.models_ready and not self._startup_reported:
+            self._startup_reported = True
+            self.startup.mark("first tracked frame")
+            print(self.startup.report())
+
+        # The packet is never touched again once published, so the widget
+        # and screenshots can share its buffer.
+        frame = packet.frame
+        with self.metrics.time("display"):
+            self.video_label.set_frame(frame)
+        self.current_frame = frame
+        plot_interval = self.quality_level["plot_interval_ms"]
+        if self.plot_timer is not None and self.plot_timer.interval() != plot_interval:
+            self.plot_timer.setInterval(plot_interval)
+
+        self.rep_label.setText(self.rep_text)
+        if self.models_ready:
+            self.feedback_label.setText(packet.feedback)
+        else:
+            self.feedback_label.setText("Loading pose models...")
 
     def closeEvent(self, event):
-        self.cap.release()
-        if self.video_writer:
-            self.video_writer.release()
-        if self.music_playing:
-            pygame.mixer.music.stop()
-        self.plot3d.running = False
+        self.timer.stop()
+        self.engine.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        if self.landmark_writer is not None:
+            self.landmark_store.detach_writer()
+            self.landmark_writer.close(timeout=5.0)
+        self.stop_recording()
+        if self.session is not None:
+            self.session.close(timeout=5.0)
+        self.narrator.stop()
+        if self.music is not None:
+            self.music.close()
+        if self.plot_timer is not None:
+            self.plot_timer.stop()
         super().closeEvent(event)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = NeonPoseApp()
+    startup = StartupTimer(_STARTED)
+    startup.record("imports", _STARTED)
+    with startup.phase("Qt application"):
+        app = QApplication(sys.argv)
+    # Optional first argument: camera index, video file, image folder,
+    # frame cache (.npy) or "synthetic".
+    source = open_source(sys.argv[1], realtime=True) if len(sys.argv) > 1 else None
+    window = NeonPoseApp(source, startup)
     window.show()
+    startup.mark("window shown")
     sys.exit(app.exec_())
\ No newline at end of file
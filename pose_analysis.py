@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+
+from pose_rules import RuleState, load_rules
+
+
+class PoseAnalysis:
+    # What one frame produced: text for the feedback label, alerts to
+    # speak (in order), and events worth keeping, as (name, value) pairs.
+    # The feedback text itself is commentary the caller may also speak.
+    def __init__(self):
+        self.feedback = ""
+        self.narration = []
+        self.events = []
+        self.pose_correct = False
+
+
+class PoseAnalyzer:
+    # Rep counting, posture reminder, custom-pose alert and yoga pose checks
+    # for one person. The checks themselves come from a rules file (see
+    # pose_rules.py); this class holds the per-person state and turns rule
+    # transitions into feedback. No Qt dependency, so the GUI and the batch
+    # tools score the same way.
+    def __init__(self, rules=None, pose_library=None, match_distance=0.25):
+        self.rules = rules if rules is not None else load_rules()
+        # Custom pose alerts: the closest PoseLibrary entry within
+        # match_distance (hips-to-shoulders lengths) counts as a match.
+        self.pose_library = pose_library
+        self.match_distance = match_distance
+        self.reset()
+
+    def reset(self):
+        self.rep_count = 0
+        self.in_pose = False
+        self.state = self.rules.new_state()
+
+    def analyze(self, pose_frame, pose_name=None, timestamp=None):
+        # pose_name is the active yoga flow pose, or None outside a flow.
+        return analyze_people([self], [pose_frame], pose_name, timestamp)[0]
+
+    def is_active(self, rule_name):
+        return bool(self.state.active[0, self.rules.index[rule_name]])
+
+    def _apply(self, pose_name, entered, values, matches):
+        result = PoseAnalysis()
+        rules = self.rules
+        feedback = ""
+        fired = np.flatnonzero(entered)
+
+        for i in fired:
+            if rules.rules[i].get("count_reps"):
+                self.rep_count += 1
+                result.events.append(("rep", self.rep_count))
+
+        # Custom Pose Alerts (nearest pose in the library)
+        if matches and matches[0][1] < self.match_distance:
+            name, dist = matches[0]
+            feedback += f"Custom pose matched: {name}! "
+            result.narration.append(f"Custom pose matched: {name}!")
+            result.events.append(("custom_pose", dist))
+
+        # Alerts such as the posture reminder
+        for i in fired:
+            say = rules.rules[i].get("say")
+            if say:
+                feedback += say
+                result.narration.append(say)
+                result.events.append((rules.names[i], float(values[i])))
+
+        if pose_name is not None:
+            rule = rules.index.get(pose_name)
+            pose_correct = rule is not None and bool(self.state.active[0, rule])
+            if rule is not None:
+                feedback += rules.rules[rule].get("feedback" if pose_correct else "hint", "")
+            if pose_correct and not self.in_pose:
+                result.narration.append("Pose correct. Hold it.")
+                result.events.append(("pose_correct", pose_name))
+                self.in_pose = True
+            elif not pose_correct and self.in_pose:
+                result.narration.append("Pose lost. Try again.")
+                result.events.append(("pose_lost", pose_name))
+                self.in_pose = False
+            result.pose_correct = pose_correct
+        else:
+            # Default feedback if not in yoga flow
+            active = self.state.active[0]
+            for item in rules.idle_feedback:
+                when = item.get("when")
+                if when is None or active[rules.index[when]]:
+                    feedback = item["text"]
+                    break
+
+        result.feedback = feedback
+        return result
+
+
+def analyze_people(analyzers, pose_frames, pose_name=None, timestamp=None):
+    # Scores several people in one batched pass per rule set (and one pose
+    # library query), then applies each person's results to their own
+    # analyzer.
+    now = time.monotonic() if timestamp is None else timestamp
+    results = [None] * len(analyzers)
+    groups = {}
+    for i, analyzer in enumerate(analyzers):
+        groups.setdefault((id(analyzer.rules), id(analyzer.pose_library)), []).append(i)
+    for members in groups.values():
+        rules = analyzers[members[0]].rules
+        library = analyzers[members[0]].pose_library
+        states = [analyzers[i].state for i in members]
+        data = np.stack([pose_frames[i].data for i in members])
+        state = states[0] if len(states) == 1 else RuleState.stack(states)
+        entered, _, values = rules.evaluate(data, state, now)
+        if len(states) > 1:
+            state.scatter(states)
+        matches = library.query_many(data) if library is not None else [None] * len(members)
+        for row, i in enumerate(members):
+            results[i] = analyzers[i]._apply(pose_name, entered[row], values[row], matches[row])
+    return results
@@ -0,0 +1,308 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+
+
+class HandLandmark:
+    __slots__ = ("x", "y", "z")
+
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+
+class HandLandmarkList:
+    __slots__ = ("landmark",)
+
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class HandsEstimate:
+    # Stand-in for a mediapipe Hands result on frames where the model did
+    # not run (skipped or gated). Same attribute names as the real thing.
+    def __init__(self, multi_hand_landmarks=None, multi_handedness=None):
+        self.multi_hand_landmarks = multi_hand_landmarks
+        self.multi_handedness = multi_handedness
+
+
+class ModelLoader:
+    # Imports mediapipe and builds the Pose / Hands graphs on a background
+    # thread, then runs each once on a blank frame so the first real frame
+    # doesn't pay for model loading. Poll `ready`; `mp` is the imported
+    # module (for building more graphs later), `error` is set on failure.
+    def __init__(self, pose_options=None, hands_options=None, hands=True,
+                 warmup_shape=(480, 640, 3), timer=None):
+        self.pose_options = pose_options or {}
+        self.hands_options = hands_options or {}
+        self.load_hands = hands
+        self.warmup_shape = warmup_shape
+        self.timer = timer
+        self.mp = None
+        self.pose = None
+        self.hands = None
+        self.error = None
+        self.ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="model-warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _phase(self, name, fn):
+        start = time.perf_counter()
+        result = fn()
+        if self.timer is not None:
+            self.timer.record(name, start)
+        return result
+
+    def _run(self):
+        try:
+            self.mp = self._phase("import mediapipe", self._import)
+            blank = np.zeros(self.warmup_shape, np.uint8)
+            pose = self._phase("pose model", lambda: self.mp.solutions.pose.Pose(**self.pose_options))
+            self._phase("pose warm-up", lambda: pose.process(blank))
+            self.pose = pose
+            if self.load_hands:
+                hands = self._phase("hands model", lambda: self.mp.solutions.hands.Hands(**self.hands_options))
+                self._phase("hands warm-up", lambda: hands.process(blank))
+                self.hands = hands
+        except Exception as e:
+            self.error = e
+            print("Model Error:", e)
+        finally:
+            self.ready.set()
+
+    def _import(self):
+        import mediapipe
+
+        return mediapipe
+
+
+class GraphCache:
+    # MediaPipe graphs by kind ("pose" / "hands") and constructor options.
+    # A graph that isn't cached yet is built and warmed up on a background
+    # thread; callback(kind, options, graph) runs when it is ready (right
+    # away when cached, with graph None when building failed). Graphs are
+    # kept, so moving back and forth between quality levels pays for each
+    # one only once.
+    def __init__(self, mp, warmup_shape=(480, 640, 3)):
+        self.mp = mp
+        self.warmup_shape = warmup_shape
+        self._graphs = {}
+        self._waiting = {}  # key -> callbacks for a graph being built
+        self._lock = threading.Lock()
+
+    def _key(self, kind, options):
+        return kind, tuple(sorted(options.items()))
+
+    def put(self, kind, options, graph):
+        with self._lock:
+            self._graphs[self._key(kind, options)] = graph
+
+    def request(self, kind, options, callback):
+        key = self._key(kind, options)
+        with self._lock:
+            graph = self._graphs.get(key)
+            if graph is None:
+                building = key in self._waiting
+                self._waiting.setdefault(key, []).append(callback)
+        if graph is not None:
+            callback(kind, options, graph)
+            return
+        if not building:
+            threading.Thread(
+                target=self._build, args=(key, kind, dict(options)), name=f"build-{kind}", daemon=True
+            ).start()
+
+    def _build(self, key, kind, options):
+        graph = None
+        try:
+            factory = self.mp.solutions.pose.Pose if kind == "pose" else self.mp.solutions.hands.Hands
+            graph = factory(**options)
+            graph.process(np.zeros(self.warmup_shape, np.uint8))
+        except Exception as e:
+            print("Model Error:", e)
+            graph = None
+        with self._lock:
+            if graph is not None:
+                self._graphs[key] = graph
+            callbacks = self._waiting.pop(key, [])
+        for callback in callbacks:
+            callback(kind, options, graph)
+
+
+class InferenceScheduler:
+    # Decides per frame which MediaPipe graphs run, and runs them side by side.
+    #
+    # pose_every / hands_every: run the model on every Nth frame only. Skipped
+    #     pose frames reuse the last result; skipped hand frames move the last
+    #     hand landmarks along with the pose wrists.
+    # gate_hands: only run hands when the previous pose had a visible wrist.
+    # crop_hands: feed the hand model a crop around the wrists instead of the
+    #     whole frame, then map the landmarks back to full-frame coordinates.
+    # motion_gate: a landmark_filter.MotionGate; while the scene is static
+    #     neither model runs and the last results are reused.
+    def __init__(self, pose=None, hands=None, pose_every=1, hands_every=1, parallel=True,
+                 gate_hands=False, crop_hands=False, wrist_visibility=0.5, crop_margin=1.0,
+                 motion_gate=None):
+        self.pose = pose
+        self.hands = hands
+        self.pose_every = max(1, pose_every)
+        self.hands_every = max(1, hands_every)
+        self.gate_hands = gate_hands
+        self.crop_hands = crop_hands
+        self.wrist_visibility = wrist_visibility
+        self.crop_margin = crop_margin
+        self.motion_gate = motion_gate
+        self.frame_index = 0
+        self.last_pose = None
+        self.last_hands = None
+        self.pose_ran = False  # whether the last process() call ran the pose model
+        self.runs = {"pose": 0, "hands": 0, "hands_skipped": 0, "hands_gated": 0, "static_skipped": 0}
+        self._hand_anchor = None
+        self.metrics = None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pose-hands") if parallel else None
+
+    def process(self, rgb):
+        index = self.frame_index
+        self.frame_index += 1
+        self.pose_ran = False
+        if self.motion_gate is not None and self.last_pose is not None and not self._moving(rgb):
+            self.runs["static_skipped"] += 1
+            return self.last_pose, None if self.hands is None else self._interpolate_hands()
+        run_pose = self.pose is not None and (index % self.pose_every == 0 or self.last_pose is None)
+        run_hands = self.hands is not None and index % self.hands_every == 0
+
+        if self.hands is not None and self.gate_hands and self._visible_wrists(self.last_pose) is None:
+            run_hands = False
+            self.last_hands = None
+            self.runs["hands_gated"] += 1
+            if run_pose:
+                self._run_pose(rgb)
+            return self.last_pose, HandsEstimate()
+
+        region = self._hand_region(self.last_pose, rgb.shape) if run_hands and self.crop_hands else None
+        hands_future = None
+        if run_hands and run_pose and self._pool is not None:
+            # The hand graph runs on the pool while pose runs here; MediaPipe
+            # releases the GIL inside process() so the two really overlap.
+            hands_future = self._pool.submit(self._run_hands, rgb, region)
+        if run_pose:
+            self._run_pose(rgb)
+
+        if run_hands:
+            hands = hands_future.result() if hands_future is not None else self._run_hands(rgb, region)
+            self.last_hands = hands
+            self._hand_anchor = self._wrist_points(self.last_pose)
+            return self.last_pose, hands
+        if self.hands is None:
+            return self.last_pose, None
+        self.runs["hands_skipped"] += 1
+        return self.last_pose, self._interpolate_hands()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def _moving(self, rgb):
+        start = time.perf_counter()
+        moving = self.motion_gate.moving(rgb)
+        if self.metrics is not None:
+            self.metrics.record("motion", time.perf_counter() - start)
+        return moving
+
+    def _run_pose(self, rgb):
+        start = time.perf_counter()
+        self.last_pose = self.pose.process(rgb)
+        if self.metrics is not None:
+            self.metrics.record("pose", time.perf_counter() - start)
+        self.runs["pose"] += 1
+        self.pose_ran = True
+
+    def _run_hands(self, rgb, region):
+        start = time.perf_counter()
+        try:
+            return self._infer_hands(rgb, region)
+        finally:
+            if self.metrics is not None:
+                self.metrics.record("hands", time.perf_counter() - start)
+
+    def _infer_hands(self, rgb, region):
+        self.runs["hands"] += 1
+        if region is None:
+            return self.hands.process(rgb)
+        x0, y0, x1, y1 = region
+        crop = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+        results = self.hands.process(crop)
+        if results.multi_hand_landmarks:
+            h, w = rgb.shape[:2]
+            sx, sy = (x1 - x0) / w, (y1 - y0) / h
+            ox, oy = x0 / w, y0 / h
+            for hand in results.multi_hand_landmarks:
+                for lm in hand.landmark:
+                    lm.x = ox + lm.x * sx
+                    lm.y = oy + lm.y * sy
+                    lm.z = lm.z * sx
+        return results
+
+    def _wrist_points(self, pose_results):
+        if pose_results is None or not pose_results.pose_landmarks:
+            return None
+        lms = pose_results.pose_landmarks.landmark
+        return np.array([[lms[i].x, lms[i].y] for i in (LEFT_WRIST, RIGHT_WRIST)], np.float32)
+
+    def _visible_wrists(self, pose_results):
+        if pose_results is None or not pose_results.pose_landmarks:
+            return None
+        lms = pose_results.pose_landmarks.landmark
+        points = [
+            (lms[i].x, lms[i].y) for i in (LEFT_WRIST, RIGHT_WRIST)
+            if lms[i].visibility >= self.wrist_visibility and 0.0 <= lms[i].x <= 1.0 and 0.0 <= lms[i].y <= 1.0
+        ]
+        return np.array(points, np.float32) if points else None
+
+    def _hand_region(self, pose_results, shape):
+        wrists = self._visible_wrists(pose_results)
+        if wrists is None:
+            return None
+        lms = pose_results.pose_landmarks.landmark
+        shoulder_width = abs(lms[LEFT_SHOULDER].x - lms[RIGHT_SHOULDER].x)
+        h, w = shape[:2]
+        half = self.crop_margin * max(shoulder_width, 0.1) * w
+        xs = wrists[:, 0] * w
+        ys = wrists[:, 1] * h
+        x0 = int(max(0, xs.min() - half))
+        y0 = int(max(0, ys.min() - half))
+        x1 = int(min(w, xs.max() + half))
+        y1 = int(min(h, ys.max() + half))
+        # Not worth cropping if the region is most of the frame anyway.
+        if x1 - x0 < 32 or y1 - y0 < 32 or (x1 - x0) * (y1 - y0) > 0.6 * w * h:
+            return None
+        return x0, y0, x1, y1
+
+    def _interpolate_hands(self):
+        last = self.last_hands
+        if last is None or not last.multi_hand_landmarks:
+            return HandsEstimate()
+        anchor = self._hand_anchor
+        current = self._wrist_points(self.last_pose)
+        if anchor is None or current is None:
+            return HandsEstimate(last.multi_hand_landmarks, last.multi_handedness)
+        moved = current - anchor
+        hands = []
+        for hand in last.multi_hand_landmarks:
+            # Follow whichever pose wrist the hand was attached to.
+            root = np.array([hand.landmark[0].x, hand.landmark[0].y], np.float32)
+            dx, dy = moved[int(np.argmin(np.linalg.norm(anchor - root, axis=1)))]
+            hands.append(HandLandmarkList([HandLandmark(lm.x + dx, lm.y + dy, lm.z) for lm in hand.landmark]))
+        return HandsEstimate(hands, last.multi_handedness)
@@ -0,0 +1,133 @@
+import cv2
+import numpy as np
+
+NUM_POSE_LANDMARKS = 33
+NUM_HAND_LANDMARKS = 21
+
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+# Index -> name, in MediaPipe's PoseLandmark order. Rule files refer to
+# landmarks by these names.
+POSE_LANDMARK_NAMES = (
+    "nose", "left_eye_inner", "left_eye", "left_eye_outer",
+    "right_eye_inner", "right_eye", "right_eye_outer", "left_ear", "right_ear",
+    "mouth_left", "mouth_right", "left_shoulder", "right_shoulder",
+    "left_elbow", "right_elbow", "left_wrist", "right_wrist",
+    "left_pinky", "right_pinky", "left_index", "right_index",
+    "left_thumb", "right_thumb", "left_hip", "right_hip",
+    "left_knee", "right_knee", "left_ankle", "right_ankle",
+    "left_heel", "right_heel", "left_foot_index", "right_foot_index",
+)
+
+SKELETON_PAIRS = np.array([
+    (11, 13), (13, 15), (12, 14), (14, 16),
+    (11, 12), (23, 24),
+    (23, 25), (25, 27), (24, 26), (26, 28),
+    (27, 31), (28, 32)
+], np.intp)
+
+# Full BlazePose connectivity (same as mp.solutions.pose.POSE_CONNECTIONS),
+# kept here so drawing code doesn't have to import mediapipe.
+POSE_CONNECTIONS = np.array([
+    (0, 1), (1, 2), (2, 3), (3, 7), (0, 4), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (13, 15), (15, 17), (15, 19), (15, 21), (17, 19),
+    (12, 14), (14, 16), (16, 18), (16, 20), (16, 22), (18, 20),
+    (11, 23), (12, 24), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28),
+    (27, 29), (28, 30), (29, 31), (30, 32), (27, 31), (28, 32)
+], np.intp)
+
+
+class PoseFrame:
+    # One person's pose as a (33, 4) float32 array of x, y, z, visibility.
+    # Built once per frame from the MediaPipe result; everything downstream
+    # works on the array instead of the protobuf.
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_results(cls, pose_results):
+        if pose_results is None or not pose_results.pose_landmarks:
+            return None
+        return cls.from_landmarks(pose_results.pose_landmarks.landmark)
+
+    @classmethod
+    def from_landmarks(cls, landmarks):
+        flat = [v for lm in landmarks for v in (lm.x, lm.y, lm.z, lm.visibility)]
+        return cls(np.array(flat, np.float32).reshape(-1, 4))
+
+    @property
+    def xyz(self):
+        return self.data[:, :3]
+
+    @property
+    def xy(self):
+        return self.data[:, :2]
+
+    @property
+    def visibility(self):
+        return self.data[:, 3]
+
+    def pixels(self, w, h):
+        return (self.data[:, :2] * (w, h)).astype(np.int32)
+
+    def distance_to(self, reference_xyz):
+        return float(np.linalg.norm(self.xyz - reference_xyz, axis=1).mean())
+
+
+class HandFrame:
+    # All detected hands as an (n_hands, 21, 3) float32 array of x, y, z.
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_results(cls, hands_results):
+        if hands_results is None or not hands_results.multi_hand_landmarks:
+            return None
+        flat = [
+            v for hand in hands_results.multi_hand_landmarks
+            for lm in hand.landmark for v in (lm.x, lm.y, lm.z)
+        ]
+        return cls(np.array(flat, np.float32).reshape(-1, NUM_HAND_LANDMARKS, 3))
+
+    def __len__(self):
+        return len(self.data)
+
+    def pixels(self, w, h):
+        return (self.data[..., :2] * (w, h)).astype(np.int32)
+
+
+def draw_points(frame, points, radius, color):
+    # A zero-length segment with a thick pen is a filled round dot, so every
+    # point goes down in a single OpenCV call instead of one cv2.circle each.
+    # (A one-vertex polyline draws nothing.)
+    if len(points):
+        points = points.reshape(-1, 1, 2)
+        cv2.polylines(frame, np.repeat(points, 2, axis=1), False, color, radius * 2)
+
+
+def draw_pose(frame, pose_frame, color):
+    h, w = frame.shape[:2]
+    px = pose_frame.pixels(w, h)
+    draw_points(frame, px, 5, color)
+    cv2.polylines(frame, px[SKELETON_PAIRS], False, color, 2)
+
+
+def draw_hands(frame, hand_frame, color=(0, 255, 255)):
+    h, w = frame.shape[:2]
+    draw_points(frame, hand_frame.pixels(w, h).reshape(-1, 2), 4, color)
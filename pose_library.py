@@ -0,0 +1,145 @@
+import json
+import os
+
+import numpy as np
+
+from pose_landmarks import (
+    LEFT_HIP, LEFT_SHOULDER, NUM_POSE_LANDMARKS, POSE_LANDMARK_NAMES, RIGHT_HIP, RIGHT_SHOULDER,
+)
+
+# Landmark order of the left/right mirrored body.
+MIRROR_INDEX = np.array([
+    POSE_LANDMARK_NAMES.index(
+        name.replace("left", "\0").replace("right", "left").replace("\0", "right")
+    )
+    for name in POSE_LANDMARK_NAMES
+], np.intp)
+
+
+def normalize_pose(data):
+    # (..., 33, 4) landmarks -> (..., 33, 3) of across, up, visibility in a
+    # body frame: origin between the hips, unit length hips-to-shoulders,
+    # "up" along the spine. Where someone stands, how far they are from
+    # the camera and how they lean no longer change the numbers.
+    data = np.asarray(data, np.float32)
+    xy = data[..., :2]
+    hips = xy[..., [LEFT_HIP, RIGHT_HIP], :].mean(axis=-2)
+    shoulders = xy[..., [LEFT_SHOULDER, RIGHT_SHOULDER], :].mean(axis=-2)
+    spine = shoulders - hips
+    length = np.maximum(np.linalg.norm(spine, axis=-1, keepdims=True), 1e-6)
+    up = spine / length
+    across = np.stack([-up[..., 1], up[..., 0]], axis=-1)
+    centered = xy - hips[..., None, :]
+    out = np.empty(data.shape[:-1] + (3,), np.float32)
+    out[..., 0] = (centered * across[..., None, :]).sum(axis=-1) / length
+    out[..., 1] = (centered * up[..., None, :]).sum(axis=-1) / length
+    out[..., 2] = np.clip(data[..., 3], 0.0, 1.0)
+    return out
+
+
+def mirror_pose(normalized):
+    mirrored = normalized[..., MIRROR_INDEX, :].copy()
+    mirrored[..., 0] *= -1
+    return mirrored
+
+
+def _names_path(path):
+    return os.path.splitext(path)[0] + '.names.json'
+
+
+class PoseLibrary:
+    # Reference poses stored normalized in one (n, 33, 3) matrix. A query
+    # scores a frame (or every tracked person at once) against the whole
+    # library with a few matrix products. The distance is the
+    # visibility-weighted RMS landmark offset, in hips-to-shoulders lengths.
+    def __init__(self, names=None, poses=None):
+        self.names = list(names or [])
+        if poses is None:
+            poses = np.zeros((0, NUM_POSE_LANDMARKS, 3), np.float32)
+        self.poses = poses
+        self._prepare()
+
+    def __len__(self):
+        return len(self.names)
+
+    def _prepare(self):
+        # Per-reference terms of the expanded squared distance, so a query
+        # never touches the library element by element. Swapped in as one
+        # tuple: the GUI adds poses while the render thread is querying.
+        poses = np.asarray(self.poses, np.float32)
+        vis = np.array(poses[..., 2])
+        weighted = (poses[..., :2] * vis[..., None]).reshape(len(poses), NUM_POSE_LANDMARKS * 2)
+        sq = vis * (poses[..., :2] ** 2).sum(axis=-1)
+        self._index = (list(self.names), vis, weighted, sq)
+
+    def add(self, name, data):
+        # Adds the landmarks of one person under `name`; an existing pose of
+        # the same name is replaced.
+        pose = normalize_pose(data)[None]
+        if name in self.names:
+            poses = np.array(self.poses)
+            poses[self.names.index(name)] = pose[0]
+        else:
+            self.names = self.names + [name]
+            poses = np.concatenate([np.asarray(self.poses, np.float32), pose])
+        self.poses = poses
+        self._prepare()
+
+    def remove(self, name):
+        i = self.names.index(name)
+        self.names = self.names[:i] + self.names[i + 1:]
+        self.poses = np.delete(np.asarray(self.poses), i, axis=0)
+        self._prepare()
+
+    def query(self, data, k=1, mirror=True):
+        # Best `k` matches for one person's landmarks as (name, distance).
+        return self.query_many(np.asarray(data)[None], k, mirror)[0]
+
+    def query_many(self, data, k=1, mirror=True):
+        # data: (people, 33, 4). With mirror=True a pose also matches its
+        # left/right mirror image.
+        names, ref_vis, ref_weighted, ref_sq = self._index
+        if not names or not len(data):
+            return [[] for _ in range(len(data))]
+        queries = normalize_pose(data)
+        if mirror:
+            queries = np.concatenate([queries, mirror_pose(queries)])
+        vis = queries[..., 2]
+        weighted = (queries[..., :2] * vis[..., None]).reshape(len(queries), NUM_POSE_LANDMARKS * 2)
+        sq = vis * (queries[..., :2] ** 2).sum(axis=-1)
+        # sum_i vq vr |q - r|^2 = sum vq q^2 vr - 2 sum (vq q)(vr r) + sum vq vr r^2
+        num = sq @ ref_vis.T - 2.0 * (weighted @ ref_weighted.T) + vis @ ref_sq.T
+        den = vis @ ref_vis.T
+        dist = np.sqrt(np.maximum(num, 0.0) / np.maximum(den, 1e-6))
+        if mirror:
+            dist = np.minimum(dist[:len(data)], dist[len(data):])
+        k = min(k, len(names))
+        if k < len(names):
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(k), (len(dist), 1))
+        results = []
+        for row, idx in zip(dist, top):
+            idx = idx[np.argsort(row[idx])]
+            results.append([(names[i], float(row[i])) for i in idx])
+        return results
+
+    def save(self, path):
+        # <path> holds the (n, 33, 3) float32 matrix as a plain .npy so load
+        # can memory-map it; the names go next to it as JSON. Written to a
+        # temporary file first: a library loaded from `path` may still have
+        # it mapped.
+        with open(path + '.part', 'wb') as f:
+            np.save(f, np.asarray(self.poses, np.float32))
+        os.replace(path + '.part', path)
+        with open(_names_path(path), 'w') as f:
+            json.dump(self.names, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        poses = np.load(path, mmap_mode='r' if mmap else None)
+        with open(_names_path(path)) as f:
+            names = json.load(f)
+        if len(names) != len(poses):
+            raise ValueError(f"{path}: {len(poses)} poses but {len(names)} names")
+        return cls(names, poses)
@@ -0,0 +1,183 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+class LatencyHistogram:
+    # Keeps the last `window` samples (seconds) in a ring; percentiles are
+    # only computed when someone asks for them.
+    def __init__(self, window=1024):
+        self.samples = np.zeros(window, np.float64)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples[self.count % len(self.samples)] = seconds
+        self.count += 1
+        self.total += seconds
+
+    def summary(self):
+        n = min(self.count, len(self.samples))
+        if n == 0:
+            return {"count": 0}
+        p50, p95, p99 = np.percentile(self.samples[:n], (50, 95, 99)) * 1000.0
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000.0,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+        }
+
+
+class StageMetrics:
+    # Per-stage latency histograms for the frame path. Stages are created on
+    # first use, so any component can time itself with
+    #     with metrics.time("pose"): ...
+    def __init__(self, window=1024):
+        self.window = window
+        self.stages = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        hist = self.stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self.stages.setdefault(stage, LatencyHistogram(self.window))
+        hist.add(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            stages = dict(self.stages)
+        return {name: hist.summary() for name, hist in sorted(stages.items())}
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.started = time.time()
+
+    def json_line(self):
+        return json.dumps({"time": time.time(), "stages": self.snapshot()})
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP neon_pose_stage_latency_ms Rolling per-stage latency of the frame path.",
+            "# TYPE neon_pose_stage_latency_ms summary",
+        ]
+        for name, s in self.snapshot().items():
+            if not s["count"]:
+                continue
+            for q in ("50", "95", "99"):
+                lines.append(f'neon_pose_stage_latency_ms{{stage="{name}",quantile="0.{q}"}} {s["p" + q + "_ms"]:.3f}')
+            lines.append(f'neon_pose_stage_latency_ms_count{{stage="{name}"}} {s["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+class JsonLinesExporter:
+    # Appends a metrics snapshot to `path` every `interval` seconds.
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pose-metrics-jsonl", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with open(self.path, 'a') as f:
+                f.write(self.metrics.json_line() + "\n")
+
+    def stop(self):
+        self._stop.set()
+
+
+class MetricsServer:
+    # Serves /metrics (Prometheus text) and /metrics.json on localhost.
+    def __init__(self, metrics, port=9464, host="127.0.0.1", extra=None):
+        self.metrics = metrics
+        self.extra = extra  # optional callable returning more JSON fields
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = server.metrics.prometheus_text().encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    data = {"stages": server.metrics.snapshot()}
+                    if server.extra is not None:
+                        data.update(server.extra())
+                    body = json.dumps(data).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="pose-metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class StartupTimer:
+    # Wall-clock phases of application start-up, relative to `origin`
+    # (a time.perf_counter() value, e.g. taken before the heavy imports).
+    # Phases may overlap: background warm-up runs alongside the UI.
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end=None):
+        end = time.perf_counter() if end is None else end
+        with self._lock:
+            self.phases.append((name, start - self.origin, end - start, threading.current_thread().name))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def mark(self, name):
+        # A point in time rather than a span ("window shown").
+        now = time.perf_counter()
+        self.record(name, now, now)
+
+    def report(self):
+        with self._lock:
+            phases = sorted(self.phases, key=lambda p: p[1])
+        lines = ["Startup timing (s):"]
+        for name, start, seconds, thread in phases:
+            took = f"{seconds:7.3f}" if seconds > 0 else f"{'':7}"
+            where = "" if thread == "MainThread" else f"  [{thread}]"
+            lines.append(f"  {start:7.3f} +{took}  {name}{where}")
+        return "\n".join(lines)
@@ -0,0 +1,494 @@
+import argparse
+import collections
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from frame_sources import open_source
+from landmark_filter import MotionGate, PoseSmoother
+from pose_inference import InferenceScheduler
+from pose_metrics import StageMetrics
+
+
+class DropOldestQueue:
+    # Bounded hand-off between stages: a slow consumer loses the oldest
+    # frames instead of making the producer wait. With block=True the
+    # producer waits instead (replays and benchmarks that must see every
+    # frame).
+    def __init__(self, maxsize=2, block=False):
+        self.maxsize = maxsize
+        self.block = block
+        self.dropped = 0
+        self.closed = False
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            if self.block:
+                while len(self._items) >= self.maxsize and not self.closed:
+                    self._cond.wait(0.1)
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        with self._cond:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items and not self.closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            return None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _pool_refcount():
+    probe = [np.zeros(1, np.uint8)]
+    return sys.getrefcount(probe[0])
+
+
+class FramePool:
+    # Reusable frame buffers for the capture and convert steps. A buffer is
+    # handed out again only once nothing but the pool refers to it, so
+    # whoever holds on to a frame (the recorder queue, the widget, a
+    # screenshot, a view of it) keeps it safe just by keeping a reference,
+    # and never has to give it back.
+    _FREE = _pool_refcount()
+
+    def __init__(self, max_buffers=16, max_shapes=4):
+        self.max_buffers = max_buffers
+        self.max_shapes = max_shapes
+        self.allocated = 0
+        self.reused = 0
+        # (shape, dtype) -> buffers, most recently used last. Full-size
+        # frames and scaled inference input are recycled side by side.
+        self._buffers = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        key = (tuple(shape), np.dtype(dtype))
+        with self._lock:
+            buffers = self._buffers.get(key)
+            if buffers is None:
+                # New frame size (camera switch, quality change): sizes not
+                # asked for in a while stop being recycled; whoever still
+                # holds one of their buffers keeps it.
+                buffers = self._buffers[key] = []
+                while len(self._buffers) > self.max_shapes:
+                    self._buffers.popitem(last=False)
+            else:
+                self._buffers.move_to_end(key)
+            for i in range(len(buffers)):
+                if sys.getrefcount(buffers[i]) <= self._FREE:
+                    self.reused += 1
+                    return buffers[i]
+            buffer = np.empty(shape, dtype)
+            self.allocated += 1
+            if len(buffers) < self.max_buffers:
+                buffers.append(buffer)
+            return buffer
+
+
+class FramePacket:
+    def __init__(self, index, timestamp, frame):
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+        self.captured_at = time.time()
+        self.raw = None
+        self.rgb = None
+        self.pose_results = None
+        self.hands_results = None
+        self.pose_frame = None
+        self.hand_frame = None
+        self.people = None
+        self.feedback = ""
+        self.inference_time = None  # seconds, when a model ran on this frame
+
+
+class FrameEngine:
+    # Capture -> inference -> render -> sinks, each on its own thread.
+    # Consumers (the Qt widget, a benchmark) only ever look at latest().
+    # Every stage reports its latency to self.metrics; lossless=True makes
+    # the queues wait instead of dropping frames.
+    def __init__(self, source, pose=None, hands=None, render=None, mirror=True, queue_size=2,
+                 scheduler=None, metrics=None, lossless=False):
+        self.source = source
+        self.metrics = metrics or StageMetrics()
+        self.scheduler = scheduler or InferenceScheduler(pose, hands)
+        if self.scheduler.metrics is None:
+            self.scheduler.metrics = self.metrics
+        self.lossless = lossless
+        self.tracker = None  # MultiPersonTracker, when tracking several people; see set_tracker
+        self._retired_trackers = []
+        # landmark_filter.PoseSmoother: when set, packet.pose_frame is built
+        # here, smoothed, and extrapolated on frames the pose model skipped.
+        self.smoother = None
+        # Inference runs on the frame scaled by input_scale; landmarks come
+        # back normalized, so drawing on the full-size frame is unaffected.
+        self.input_scale = 1.0
+        # quality_control.QualityController, fed each frame's cost.
+        self.quality = None
+        self.render = render
+        self.mirror = mirror
+        self.keep_raw = False
+        self.queue_size = queue_size
+        # Frames, RGB copies and raw copies are written with dst= into
+        # recycled buffers instead of fresh allocations.
+        self.pool = FramePool()
+        self._scratch = None
+        self.sinks = []
+        self.running = False
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self.start_time = None
+        self.finished = threading.Event()
+        self._latest = None
+        self._latest_lock = threading.Lock()
+        self._source_lock = threading.Lock()
+        self._threads = []
+        self._make_queues()
+
+    def _make_queues(self):
+        self.capture_queue = DropOldestQueue(self.queue_size, self.lossless)
+        self.render_queue = DropOldestQueue(self.queue_size, self.lossless)
+        self.sink_queue = DropOldestQueue(self.queue_size, self.lossless)
+
+    def set_tracker(self, tracker):
+        # The tracker being replaced may be in use on the inference thread
+        # right now, so that thread closes it once it has moved on.
+        old, self.tracker = self.tracker, tracker
+        if old is not None and old is not tracker:
+            if self.running:
+                self._retired_trackers.append(old)
+            else:
+                old.close()
+
+    def _close_retired_trackers(self):
+        while self._retired_trackers:
+            self._retired_trackers.pop().close()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def set_source(self, source):
+        with self._source_lock:
+            old = self.source
+            self.source = source
+        if old is not None and old is not source:
+            old.release()
+
+    def latest(self):
+        with self._latest_lock:
+            return self._latest
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.finished.clear()
+        self.start_time = time.perf_counter()
+        self.frames_captured = 0
+        self.frames_processed = 0
+        self._make_queues()
+        stages = [
+            (self._capture_loop, "capture"),
+            (self._inference_loop, "inference"),
+            (self._render_loop, "render"),
+            (self._sink_loop, "sink"),
+        ]
+        self._threads = [
+            threading.Thread(target=target, name=f"pose-{name}", daemon=True)
+            for target, name in stages
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self, release_source=True):
+        self.running = False
+        for q in (self.capture_queue, self.render_queue, self.sink_queue):
+            q.close()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._threads = []
+        self.scheduler.close()
+        self._close_retired_trackers()
+        if self.tracker is not None:
+            self.tracker.close()
+        if release_source and self.source is not None:
+            self.source.release()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.start_time if self.start_time else 0.0
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_processed": self.frames_processed,
+            "elapsed": elapsed,
+            "fps": self.frames_processed / elapsed if elapsed > 0 else 0.0,
+            "dropped_capture": self.capture_queue.dropped,
+            "dropped_render": self.render_queue.dropped,
+            "dropped_sink": self.sink_queue.dropped,
+            "buffers_allocated": self.pool.allocated,
+            "buffers_reused": self.pool.reused,
+            "quality": self.quality.level["name"] if self.quality is not None else "fixed",
+            "stages": self.metrics.snapshot(),
+        }
+
+    def _capture_loop(self):
+        index = 0
+        shape = None
+        while self.running:
+            start = time.perf_counter()
+            # Mirrored: decode into a scratch frame that never leaves this
+            # thread, then flip into a pooled one. Otherwise decode straight
+            # into a pooled frame.
+            if self.mirror:
+                target = self._scratch
+            else:
+                target = self.pool.acquire(shape) if shape is not None else None
+            with self._source_lock:
+                source = self.source
+                ret, frame = source.read(target) if source is not None else (False, None)
+            if not ret:
+                # No source yet (the camera is still opening) or a live
+                # source hiccup: wait. A replay that ran out: stop.
+                if source is None or getattr(source, "is_live", True):
+                    time.sleep(0.005)
+                    continue
+                break
+            self.metrics.record("capture", time.perf_counter() - start)
+            shape = frame.shape
+            if self.mirror:
+                self._scratch = frame
+                with self.metrics.time("flip"):
+                    frame = cv2.flip(frame, 1, dst=self.pool.acquire(frame.shape, frame.dtype))
+            # Sources report their own clock (media time for replays), so a
+            # replay yields the same timestamps every run.
+            timestamp = getattr(source, "timestamp", None)
+            self.capture_queue.put(FramePacket(index, time.time() if timestamp is None else timestamp, frame))
+            self.frames_captured += 1
+            index += 1
+        self.capture_queue.close()
+
+    def _inference_loop(self):
+        for packet in self._drain(self.capture_queue):
+            self._close_retired_trackers()
+            try:
+                start = time.perf_counter()
+                with self.metrics.time("inference"):
+                    with self.metrics.time("convert"):
+                        frame = packet.frame
+                        scale = self.input_scale
+                        if scale != 1.0:
+                            h, w = frame.shape[:2]
+                            shape = (max(1, round(h * scale)), max(1, round(w * scale))) + frame.shape[2:]
+                            frame = cv2.resize(
+                                frame, (shape[1], shape[0]), dst=self.pool.acquire(shape, frame.dtype),
+                                interpolation=cv2.INTER_AREA,
+                            )
+                        packet.rgb = cv2.cvtColor(
+                            frame, cv2.COLOR_BGR2RGB, dst=self.pool.acquire(frame.shape, frame.dtype)
+                        )
+                    packet.pose_results, packet.hands_results = self.scheduler.process(packet.rgb)
+                    smoother = self.smoother
+                    if smoother is not None:
+                        with self.metrics.time("smooth"):
+                            packet.pose_frame = smoother.process(
+                                packet.pose_results, packet.timestamp, self.scheduler.pose_ran
+                            )
+                    tracker = self.tracker
+                    if tracker is not None:
+                        packet.people = tracker.process(packet.rgb, packet.timestamp)
+                if self.scheduler.pose_ran or tracker is not None:
+                    packet.inference_time = time.perf_counter() - start
+            except Exception as e:
+                print("Inference Error:", e)
+                continue
+            self.render_queue.put(packet)
+        self.render_queue.close()
+
+    def _render_loop(self):
+        for packet in self._drain(self.render_queue):
+            try:
+                start = time.perf_counter()
+                with self.metrics.time("render"):
+                    if self.keep_raw:
+                        frame = packet.frame
+                        packet.raw = self.pool.acquire(frame.shape, frame.dtype)
+                        np.copyto(packet.raw, frame)
+                    if self.render is not None:
+                        self.render(packet)
+            except Exception as e:
+                print("Render Error:", e)
+            render_time = time.perf_counter() - start
+            with self._latest_lock:
+                self._latest = packet
+            # Capture to finished overlay, queueing included.
+            latency = time.time() - packet.captured_at
+            self.metrics.record("latency", latency)
+            # The stages run side by side, so the slower of the two bounds
+            # the frame rate. Frames the models skipped say nothing about
+            # what the current settings cost.
+            quality = self.quality
+            if quality is not None and packet.inference_time is not None:
+                quality.observe(max(packet.inference_time, render_time), latency)
+            self.frames_processed += 1
+            if self.sinks:
+                self.sink_queue.put(packet)
+        self.sink_queue.close()
+
+    def _sink_loop(self):
+        for packet in self._drain(self.sink_queue):
+            with self.metrics.time("sink"):
+                for sink in self.sinks:
+                    try:
+                        sink(packet)
+                    except Exception as e:
+                        print("Sink Error:", e)
+        self.finished.set()
+
+    def _drain(self, queue):
+        while self.running:
+            packet = queue.get(timeout=0.1)
+            if packet is None:
+                if queue.closed:
+                    return
+                continue
+            yield packet
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pose pipeline without a display.")
+    parser.add_argument("--source", default="synthetic",
+                        help="camera index, video file, image folder, frame cache (.npy) or 'synthetic'")
+    parser.add_argument("--frames", type=int, default=300, help="stop after this many processed frames")
+    parser.add_argument("--no-hands", action="store_true", help="skip hand inference")
+    parser.add_argument("--hands-every", type=int, default=1, help="run hand inference every Nth frame")
+    parser.add_argument("--gate-hands", action="store_true", help="only run hands when a wrist is visible")
+    parser.add_argument("--crop-hands", action="store_true", help="run hands on a crop around the wrists")
+    parser.add_argument("--sequential", action="store_true", help="run pose and hands one after the other")
+    parser.add_argument("--realtime", action="store_true", help="pace replays at their native fps")
+    parser.add_argument("--lossless", action="store_true", help="process every frame instead of dropping to keep up")
+    parser.add_argument("--multi-person", action="store_true", help="detect and track several people, one pose graph each")
+    parser.add_argument("--smooth", action="store_true", help="smooth pose landmarks over time")
+    parser.add_argument("--motion-gate", action="store_true", help="skip inference while the scene is static")
+    parser.add_argument("--target-fps", type=float,
+                        help="auto-tune resolution, model complexity and hand cadence to this frame rate")
+    parser.add_argument("--stream-port", type=int, help="serve MJPEG video and landmark events on this port")
+    parser.add_argument("--stream-host", default="127.0.0.1", help="address to serve the stream on")
+    parser.add_argument("--udp", action="append", default=[], metavar="HOST:PORT",
+                        help="also send landmark events as UDP datagrams (repeatable)")
+    args = parser.parse_args(argv)
+
+    import mediapipe as mp
+
+    quality = None
+    level = {"input_scale": 1.0, "model_complexity": 1, "max_num_hands": 2, "hands_every": args.hands_every}
+    if args.target_fps:
+        from quality_control import QualityController, hands_options, pose_options
+
+        quality = QualityController(args.target_fps)
+        level = quality.level
+    pose = None if args.multi_person else mp.solutions.pose.Pose(model_complexity=level["model_complexity"])
+    hands = None if args.no_hands else mp.solutions.hands.Hands(max_num_hands=level["max_num_hands"])
+    scheduler = InferenceScheduler(
+        pose, hands, hands_every=level["hands_every"], parallel=not args.sequential,
+        gate_hands=args.gate_hands, crop_hands=args.crop_hands,
+        motion_gate=MotionGate() if args.motion_gate else None,
+    )
+    engine = FrameEngine(open_source(args.source, realtime=args.realtime), scheduler=scheduler, lossless=args.lossless)
+    if args.smooth:
+        engine.smoother = PoseSmoother()
+    if quality is not None:
+        from pose_inference import GraphCache
+
+        graphs = GraphCache(mp)
+        if pose is not None:
+            graphs.put("pose", pose_options(level), pose)
+        if hands is not None:
+            graphs.put("hands", hands_options(level), hands)
+
+        def install(kind, options, graph):
+            current = quality.level
+            if graph is None:
+                return
+            # Cached graphs start over instead of tracking from stale state.
+            if kind == "pose" and options == pose_options(current):
+                if graph is not scheduler.pose:
+                    graph.reset()
+                scheduler.pose = graph
+            elif kind == "hands" and options == hands_options(current):
+                if graph is not scheduler.hands:
+                    graph.reset()
+                scheduler.hands = graph
+
+        def apply(level):
+            engine.input_scale = level["input_scale"]
+            scheduler.hands_every = level["hands_every"]
+            if scheduler.pose is not None:
+                graphs.request("pose", pose_options(level), install)
+            if scheduler.hands is not None:
+                graphs.request("hands", hands_options(level), install)
+
+        engine.input_scale = level["input_scale"]
+        engine.quality = quality
+        quality.on_change.append(apply)
+    if args.multi_person:
+        from multi_person import MultiPersonTracker
+
+        engine.tracker = MultiPersonTracker(lambda: mp.solutions.pose.Pose())
+        engine.tracker.metrics = engine.metrics
+    stream = None
+    if args.stream_port is not None or args.udp:
+        from streaming import StreamServer
+
+        targets = [(host, int(port)) for host, port in (t.rsplit(":", 1) for t in args.udp)]
+        stream = StreamServer(
+            args.stream_port or 0, host=args.stream_host, udp_targets=targets, metrics=engine.metrics
+        )
+        engine.add_sink(stream.publish_packet)
+        print(f"Streaming at http://{args.stream_host}:{stream.port}/")
+    engine.start()
+    try:
+        while engine.frames_processed < args.frames and not engine.wait(0.1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    engine.stop()
+    if stream is not None:
+        stream.stop()
+    stats = engine.stats()
+    stages = stats.pop("stages")
+    for key, value in stats.items():
+        print(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+    for name, s in stages.items():
+        if s["count"]:
+            print(f"{name}: p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms, p99 {s['p99_ms']:.1f} ms")
+    for key, value in scheduler.runs.items():
+        print(f"{key}_runs: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
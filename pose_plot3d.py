@@ -0,0 +1,73 @@
+import numpy as np
+from matplotlib.figure import Figure
+from mpl_toolkits.mplot3d.art3d import Line3DCollection
+
+from pose_landmarks import POSE_CONNECTIONS
+
+
+class Live3DPlot:
+    # 3D skeleton view. The artists are created once and only their data
+    # changes; update() is cheap and can be called from any thread, while
+    # redraw() does the actual drawing and is meant to run on a timer on the
+    # thread that owns the canvas. Nothing is drawn if no new pose arrived.
+    #
+    # Embed self.figure in a FigureCanvasQTAgg for the GUI, or pass
+    # offscreen=True and call render() to get an RGBA array.
+    def __init__(self, interval_ms=100, offscreen=False):
+        self.interval_ms = interval_ms
+        self.paused = False
+        self.coords = None
+        self.version = 0
+        self._drawn_version = 0
+
+        self.figure = Figure(figsize=(4, 3))
+        if offscreen:
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot(111, projection='3d')
+        self.points = self.ax.scatter([], [], [], c='cyan', s=40, depthshade=False)
+        # Seeded with one segment because newer matplotlib autoscales (and
+        # fails on an empty collection) when it is added.
+        self.bones = Line3DCollection([np.zeros((2, 3))], colors='magenta')
+        self.ax.add_collection3d(self.bones)
+        self.bones.set_segments([])
+        self.ax.set_xlim(0, 1)
+        self.ax.set_ylim(0, 1)
+        self.ax.set_zlim(-0.5, 0.5)
+        self.ax.view_init(elev=10., azim=135)
+
+    def update(self, coords):
+        if self.paused or (coords is None and self.coords is None):
+            return
+        self.coords = coords
+        self.version += 1
+
+    def redraw(self):
+        if self.paused or self.version == self._drawn_version:
+            return False
+        self._drawn_version = self.version
+        coords = self.coords
+        if coords is None:
+            self.points._offsets3d = ([], [], [])
+            self.bones.set_segments([])
+        else:
+            xyz = np.asarray(coords)
+            self.points._offsets3d = (xyz[:, 0], xyz[:, 1], xyz[:, 2])
+            self.bones.set_segments(xyz[POSE_CONNECTIONS])
+        self.figure.canvas.draw_idle()
+        return True
+
+    def render(self):
+        self.redraw()
+        self.figure.canvas.draw()
+        return np.asarray(self.figure.canvas.buffer_rgba())
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def clear(self):
+        self.coords = None
+        self.version += 1
@@ -0,0 +1,243 @@
+import json
+import os
+
+import numpy as np
+
+from pose_landmarks import POSE_LANDMARK_NAMES
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pose_rules.json")
+
+# Rules file format (JSON):
+#   rules          list of rules. A rule is active when all of its "all"
+#                  conditions and at least one of its "any" conditions hold.
+#     name             referenced by flows and idle_feedback
+#     all / any        conditions, each one measurement plus bounds:
+#                        {"dx" | "dy" | "dist": [a, b]}     a minus b, or distance
+#                        {"angle": [a, b, c]}              joint angle at b, degrees
+#                      "abs": true compares the absolute value; bounds are
+#                      "lt", "gt" or "between": [lo, hi]. Coordinates are
+#                      frame-normalized with y pointing down. "hysteresis"
+#                      widens this condition's bounds by that much (in its
+#                      own unit) while the rule is active.
+#     hold_frames / hold_seconds    must hold this long before activating
+#     release_seconds               must fail this long before deactivating
+#     hysteresis       default for the rule's conditions; a rule mixing
+#                      angles with offsets/distances must set it per condition
+#     repeat           fire once per hold period instead of staying active
+#     count_reps       each activation counts a rep
+#     say              spoken and shown when the rule activates
+#     feedback / hint  shown during a flow while the pose is / isn't held
+#   idle_feedback  ordered {"when": rule, "text": ...}; the first active one
+#                  is shown outside a flow ("when" omitted: always matches)
+#   flows          name -> list of {"name": rule, "duration": s, "instruction"}  (at least one step)
+
+_MEASURES = {"dx": 2, "dy": 2, "dist": 2, "angle": 3}
+_PAIR_KINDS = ("dx", "dy", "dist")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def load_rules(path=None):
+    # The default rules file is parsed and compiled once per process.
+    global _default_rules
+    if path is None:
+        if _default_rules is None:
+            _default_rules = load_rules(DEFAULT_RULES_PATH)
+        return _default_rules
+    with open(path) as f:
+        try:
+            spec = json.load(f)
+        except json.JSONDecodeError as e:
+            raise RuleError(f"{path}: {e}") from None
+    return RuleSet(spec)
+
+
+_default_rules = None
+
+
+def _landmark(point, rule):
+    if isinstance(point, int) and 0 <= point < len(POSE_LANDMARK_NAMES):
+        return point
+    try:
+        return POSE_LANDMARK_NAMES.index(point)
+    except ValueError:
+        raise RuleError(f"rule {rule!r}: unknown landmark {point!r}") from None
+
+
+class RuleState:
+    # Per-person rule state, one row per person and one column per rule.
+    FIELDS = ("active", "run_frames", "run_start", "off_since")
+
+    def __init__(self, people, rules):
+        self.active = np.zeros((people, rules), bool)
+        self.run_frames = np.zeros((people, rules), np.int64)
+        self.run_start = np.zeros((people, rules), np.float64)
+        self.off_since = np.full((people, rules), np.nan)
+
+    @classmethod
+    def stack(cls, states):
+        batch = cls(0, 0)
+        for field in cls.FIELDS:
+            setattr(batch, field, np.concatenate([getattr(s, field) for s in states]))
+        return batch
+
+    def scatter(self, states):
+        # Writes the rows of a stacked state back to the states it came from.
+        for i, state in enumerate(states):
+            for field in self.FIELDS:
+                getattr(state, field)[:] = getattr(self, field)[i:i + 1]
+
+
+class RuleSet:
+    # A rules file compiled to flat arrays: one row per distinct measurement
+    # and one per condition, plus condition x rule membership matrices.
+    # Scoring every rule for every person is then a fixed handful of numpy
+    # operations, however many rules and people there are.
+    def __init__(self, spec):
+        self.rules = list(spec.get("rules", []))
+        self.names = [rule.get("name") for rule in self.rules]
+        if None in self.names or len(set(self.names)) != len(self.names):
+            raise RuleError("every rule needs a unique name")
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.idle_feedback = list(spec.get("idle_feedback", []))
+        self.flows = {name: list(steps) for name, steps in spec.get("flows", {}).items()}
+        for item in self.idle_feedback:
+            if item.get("when") is not None and item["when"] not in self.index:
+                raise RuleError(f"idle_feedback refers to unknown rule {item['when']!r}")
+        for flow, steps in self.flows.items():
+            if not steps:
+                raise RuleError(f"flow {flow!r} has no steps")
+            for step in steps:
+                if step.get("name") not in self.index:
+                    raise RuleError(f"flow {flow!r} refers to unknown rule {step.get('name')!r}")
+        self._compile()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def new_state(self, people=1):
+        return RuleState(people, len(self.rules))
+
+    def _compile(self):
+        measures = {}  # (kind, points) -> measurement row
+        pairs, angles = [], []
+        conditions = []  # (measure key, abs, lo, hi, rule, in "any", hysteresis)
+        for r, rule in enumerate(self.rules):
+            name = rule["name"]
+            if not rule.get("all") and not rule.get("any"):
+                raise RuleError(f"rule {name!r} has no conditions")
+            if "hysteresis" in rule:
+                # Degrees and frame-normalized offsets can't share one margin.
+                kinds = {
+                    "angle" in cond for cond in rule.get("all", []) + rule.get("any", [])
+                    if "hysteresis" not in cond
+                }
+                if len(kinds) > 1:
+                    raise RuleError(
+                        f"rule {name!r}: mixes angles with offsets, so hysteresis must be set per condition"
+                    )
+            for group in ("all", "any"):
+                for cond in rule.get(group, []):
+                    kinds = [k for k in _MEASURES if k in cond]
+                    if len(kinds) != 1:
+                        raise RuleError(f"rule {name!r}: each condition needs exactly one of {sorted(_MEASURES)}")
+                    kind = kinds[0]
+                    if len(cond[kind]) != _MEASURES[kind]:
+                        raise RuleError(f"rule {name!r}: {kind} takes {_MEASURES[kind]} landmarks")
+                    key = (kind, tuple(_landmark(p, name) for p in cond[kind]))
+                    if key not in measures:
+                        target = angles if kind == "angle" else pairs
+                        measures[key] = (kind == "angle", len(target))
+                        target.append(key)
+                    lo, hi = -np.inf, np.inf
+                    if "between" in cond:
+                        lo, hi = cond["between"]
+                    lo = cond.get("gt", lo)
+                    hi = cond.get("lt", hi)
+                    if lo == -np.inf and hi == np.inf:
+                        raise RuleError(f"rule {name!r}: condition on {kind} has no bound")
+                    margin = float(cond.get("hysteresis", rule.get("hysteresis", 0.0)))
+                    conditions.append((key, bool(cond.get("abs")), float(lo), float(hi), r, group == "any", margin))
+
+        self._pair_a = np.array([k[1][0] for k in pairs], np.intp)
+        self._pair_b = np.array([k[1][1] for k in pairs], np.intp)
+        self._pair_kind = np.array([_PAIR_KINDS.index(k[0]) for k in pairs], np.int8)
+        self._angle_points = np.array([k[1] for k in angles], np.intp).reshape(-1, 3)
+        # Angle measurements come after the pair measurements.
+        self._cond_measure = np.array(
+            [measures[c[0]][1] + (len(pairs) if measures[c[0]][0] else 0) for c in conditions], np.intp
+        )
+        self._cond_abs = np.array([c[1] for c in conditions], bool)
+        self._cond_lo = np.array([c[2] for c in conditions], np.float32)
+        self._cond_hi = np.array([c[3] for c in conditions], np.float32)
+        self._cond_rule = np.array([c[4] for c in conditions], np.intp)
+        self._cond_margin = np.array([c[6] for c in conditions], np.float32)
+
+        n_rules = len(self.rules)
+        self._all = np.zeros((len(conditions), n_rules), np.float32)
+        self._any = np.zeros((len(conditions), n_rules), np.float32)
+        for i, c in enumerate(conditions):
+            (self._any if c[5] else self._all)[i, c[4]] = 1.0
+        self._has_any = self._any.sum(axis=0) > 0
+        # The first condition's value is reported with a rule's events.
+        self._first_cond = np.array(
+            [int(np.flatnonzero(self._cond_rule == r)[0]) for r in range(n_rules)], np.intp
+        )
+
+        self._hold_frames = np.array([rule.get("hold_frames", 1) for rule in self.rules], np.int64)
+        self._hold_seconds = np.array([rule.get("hold_seconds", 0.0) for rule in self.rules], np.float64)
+        self._release_seconds = np.array([rule.get("release_seconds", 0.0) for rule in self.rules], np.float64)
+        self._repeat = np.array([bool(rule.get("repeat")) for rule in self.rules], bool)
+
+    def measure(self, data):
+        # data: (people, 33, 4) landmarks -> (people, measurements) values.
+        xy = data[..., :2]
+        n_pairs = len(self._pair_a)
+        values = np.empty((len(data), n_pairs + len(self._angle_points)), np.float32)
+        if n_pairs:
+            d = xy[:, self._pair_a] - xy[:, self._pair_b]
+            values[:, :n_pairs] = np.where(
+                self._pair_kind == 0, d[..., 0],
+                np.where(self._pair_kind == 1, d[..., 1], np.hypot(d[..., 0], d[..., 1])),
+            )
+        if len(self._angle_points):
+            b = xy[:, self._angle_points[:, 1]]
+            v1 = xy[:, self._angle_points[:, 0]] - b
+            v2 = xy[:, self._angle_points[:, 2]] - b
+            cross = v1[..., 0] * v2[..., 1] - v1[..., 1] * v2[..., 0]
+            dot = (v1 * v2).sum(axis=-1)
+            values[:, n_pairs:] = np.degrees(np.abs(np.arctan2(cross, dot)))
+        return values
+
+    def evaluate(self, data, state, now):
+        # Scores every rule for every person in `data` and advances `state`.
+        # Returns (entered, exited, values), each (people, rules): rules that
+        # became active or inactive this frame, and each rule's first
+        # condition value.
+        values = self.measure(data)[:, self._cond_measure]
+        values = np.where(self._cond_abs, np.abs(values), values)
+        # Hysteresis: an active rule's bounds are loosened so it doesn't
+        # flicker when a measurement sits right on the threshold.
+        margin = self._cond_margin * state.active[:, self._cond_rule]
+        ok = ((values > self._cond_lo - margin) & (values < self._cond_hi + margin)).astype(np.float32)
+        failed_all = (1.0 - ok) @ self._all
+        passed_any = ok @ self._any
+        raw = (failed_all == 0) & (~self._has_any | (passed_any > 0))
+
+        state.run_frames = np.where(raw, state.run_frames + 1, 0)
+        state.run_start = np.where(raw & (state.run_frames == 1), now, state.run_start)
+        held = raw & (state.run_frames >= self._hold_frames) & (now - state.run_start >= self._hold_seconds)
+        state.off_since = np.where(raw, np.nan, np.where(np.isnan(state.off_since), now, state.off_since))
+        released = ~raw & (now - state.off_since >= self._release_seconds)
+
+        active = np.where(state.active, ~released, held)
+        entered = active & ~state.active
+        exited = state.active & ~active
+        # Repeating rules fire and start counting the next hold right away.
+        fired = entered & self._repeat
+        active &= ~fired
+        state.run_frames = np.where(fired, 0, state.run_frames)
+        state.active = active
+        return entered, exited, values[:, self._first_cond]
@@ -0,0 +1,136 @@
+import collections
+import time
+
+import numpy as np
+
+# Quality ladder, best first; every step down is cheaper than the one above.
+#   input_scale        inference input size relative to the captured frame
+#   model_complexity   pose model (0 lite, 1 full, 2 heavy)
+#   max_num_hands      hands the hand model looks for
+#   hands_every        run hand inference every Nth frame
+#   plot_interval_ms   3D plot redraw interval
+QUALITY_LEVELS = [
+    {"name": "ultra", "input_scale": 1.0, "model_complexity": 2, "max_num_hands": 2,
+     "hands_every": 1, "plot_interval_ms": 100},
+    {"name": "high", "input_scale": 1.0, "model_complexity": 1, "max_num_hands": 2,
+     "hands_every": 2, "plot_interval_ms": 100},
+    {"name": "medium", "input_scale": 1.0, "model_complexity": 1, "max_num_hands": 2,
+     "hands_every": 3, "plot_interval_ms": 200},
+    {"name": "low", "input_scale": 0.75, "model_complexity": 0, "max_num_hands": 2,
+     "hands_every": 3, "plot_interval_ms": 300},
+    {"name": "minimal", "input_scale": 0.5, "model_complexity": 0, "max_num_hands": 1,
+     "hands_every": 4, "plot_interval_ms": 500},
+]
+
+
+def level_index(name, levels=QUALITY_LEVELS):
+    return [level["name"] for level in levels].index(name)
+
+
+def pose_options(level):
+    return {"model_complexity": level["model_complexity"]}
+
+
+def hands_options(level):
+    return {"max_num_hands": level["max_num_hands"]}
+
+
+class QualityController:
+    # Walks the quality ladder to keep the per-frame cost inside a budget:
+    # 1 / target_fps for the slowest pipeline stage and, optionally, a
+    # capture-to-overlay latency limit (seconds). Decisions use the median
+    # of the last `window` frames. Hysteresis keeps it from see-sawing:
+    # - it steps down after down_after seconds over budget, but only steps
+    #   up after up_after seconds under headroom * budget;
+    # - after each change it ignores settle seconds of frames while new
+    #   graphs warm up and the queues drain;
+    # - a level it had to leave is not retried for retry_after seconds,
+    #   twice as long each time it fails again.
+    # observe() runs on the engine's render thread; on_change callbacks are
+    # called there with the new level.
+    def __init__(self, target_fps=25.0, latency_budget=None, levels=None, start="high",
+                 headroom=0.7, down_after=1.0, up_after=5.0, settle=2.0, retry_after=30.0, window=30):
+        self.levels = levels or QUALITY_LEVELS
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        self.latency_budget = latency_budget
+        self.index = level_index(start, self.levels) if isinstance(start, str) else start
+        self.headroom = headroom
+        self.down_after = down_after
+        self.up_after = up_after
+        self.settle = settle
+        self.retry_after = retry_after
+        self.changes = 0
+        self.on_change = []
+        self._costs = collections.deque(maxlen=window)
+        self._latencies = collections.deque(maxlen=window)
+        self._over_since = None
+        self._under_since = None
+        self._settle_until = 0.0
+        self._backoff = {}  # level index -> (retry at, last wait)
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    def stats(self):
+        costs = list(self._costs)
+        return {
+            "level": self.level["name"],
+            "changes": self.changes,
+            "budget_ms": self.budget * 1000.0,
+            "cost_ms": float(np.median(costs)) * 1000.0 if costs else 0.0,
+        }
+
+    def observe(self, cost, latency=None, now=None):
+        # cost: seconds the slowest stage spent on one frame. Returns the new
+        # level when this frame triggered a change, else None.
+        now = time.monotonic() if now is None else now
+        if now < self._settle_until:
+            return None
+        self._costs.append(cost)
+        if latency is not None:
+            self._latencies.append(latency)
+        if len(self._costs) < self._costs.maxlen // 2:
+            return None
+        cost = float(np.median(self._costs))
+        latency = float(np.median(self._latencies)) if self._latencies else 0.0
+        limit = self.latency_budget
+        over = cost > self.budget or (limit is not None and latency > limit)
+        under = cost < self.headroom * self.budget and (limit is None or latency < self.headroom * limit)
+        if over:
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            if now - self._over_since >= self.down_after and self.index < len(self.levels) - 1:
+                return self._set(self.index + 1, now)
+        elif under:
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            retry_at = self._backoff.get(self.index - 1, (0.0, 0.0))[0]
+            if now - self._under_since >= self.up_after and self.index > 0 and now >= retry_at:
+                return self._set(self.index - 1, now)
+        else:
+            self._over_since = self._under_since = None
+        return None
+
+    def _set(self, index, now):
+        if index > self.index:
+            # Stepping down: the level being left couldn't keep up.
+            last_wait = self._backoff.get(self.index, (0.0, 0.0))[1]
+            wait = min(last_wait * 2, self.retry_after * 16) if last_wait else self.retry_after
+            self._backoff[self.index] = (now + wait, wait)
+        self.index = index
+        self.changes += 1
+        self._costs.clear()
+        self._latencies.clear()
+        self._over_since = self._under_since = None
+        self._settle_until = now + self.settle
+        level = self.level
+        for callback in list(self.on_change):
+            try:
+                callback(level)
+            except Exception as e:
+                print("Quality Error:", e)
+        return level
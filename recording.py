@@ -0,0 +1,228 @@
+import collections
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from pose_pipeline import DropOldestQueue
+
+
+class VideoRecorder:
+    # Encodes frames on its own thread so recording never holds up tracking.
+    #
+    # Frames arrive with their capture timestamps. The container is written
+    # at a constant `fps` (estimated from the first frames when not given),
+    # and frames are repeated or skipped so playback follows real time. With
+    # timecodes=True a <path>.timestamps.csv sidecar maps every output frame
+    # to its presentation time and the capture time of the source frame.
+    def __init__(self, path, codec='mp4v', fps=None, size=None, queue_size=64,
+                 timecodes=True, probe_frames=15, metrics=None):
+        self.path = path
+        self.metrics = metrics
+        self.codec = codec
+        self.fps = fps
+        self.size = size
+        self.timecodes = timecodes
+        self.probe_frames = probe_frames
+        self.frames_in = 0
+        self.frames_written = 0
+        self.frames_repeated = 0
+        self.frames_skipped = 0
+        self.closed = False
+        self.error = None
+        self._queue = DropOldestQueue(queue_size)
+        self._writer = None
+        self._timecode_file = None
+        self._t0 = None
+        self._resized = None
+        self._thread = threading.Thread(target=self._run, name="pose-encoder", daemon=True)
+        self._thread.start()
+
+    def write(self, frame, timestamp):
+        if self.closed:
+            return
+        self.frames_in += 1
+        self._queue.put((frame, timestamp))
+
+    def close(self, wait=True):
+        self.closed = True
+        self._queue.close()
+        if wait:
+            self._thread.join()
+
+    def stats(self):
+        return {
+            "frames_in": self.frames_in,
+            "frames_written": self.frames_written,
+            "dropped": self._queue.dropped,
+            "repeated": self.frames_repeated,
+            "skipped": self.frames_skipped,
+            "fps": self.fps,
+            "error": self.error,
+        }
+
+    def _run(self):
+        probe = []
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if self._writer is None:
+                    probe.append(item)
+                    if self.fps is None and len(probe) < self.probe_frames:
+                        continue
+                    self._open(probe)
+                    for frame, ts in probe:
+                        self._encode(frame, ts)
+                    probe = []
+                    continue
+                self._encode(*item)
+            if probe:
+                self._open(probe)
+                for frame, ts in probe:
+                    self._encode(frame, ts)
+        except Exception as e:
+            self.error = e
+            print("Recording Error:", e)
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+            if self._timecode_file is not None:
+                self._timecode_file.close()
+
+    def _open(self, probe):
+        if self.fps is None:
+            stamps = np.array([ts for _, ts in probe])
+            deltas = np.diff(stamps)
+            deltas = deltas[deltas > 0]
+            self.fps = float(np.clip(1.0 / np.median(deltas), 1.0, 120.0)) if len(deltas) else 30.0
+        if self.size is None:
+            h, w = probe[0][0].shape[:2]
+            self.size = (w, h)
+        fourcc = cv2.VideoWriter_fourcc(*self.codec)
+        self._writer = cv2.VideoWriter(self.path, fourcc, self.fps, self.size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Could not open {self.path} with codec {self.codec}")
+        if self.timecodes:
+            self._timecode_file = open(os.path.splitext(self.path)[0] + '.timestamps.csv', 'w')
+            self._timecode_file.write("output_frame,pts,capture_time\n")
+        self._t0 = probe[0][1]
+
+    def _encode(self, frame, timestamp):
+        if self.metrics is None:
+            self._encode_frame(frame, timestamp)
+            return
+        with self.metrics.time("encode"):
+            self._encode_frame(frame, timestamp)
+
+    def _encode_frame(self, frame, timestamp):
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            # Encoding is synchronous, so one resize buffer serves every frame.
+            self._resized = cv2.resize(frame, self.size, dst=self._resized)
+            frame = self._resized
+        # Index of the output frame this capture time falls on.
+        target = int(round((timestamp - self._t0) * self.fps))
+        if target < self.frames_written:
+            self.frames_skipped += 1
+            return
+        while self.frames_written <= target:
+            self._writer.write(frame)
+            if self._timecode_file is not None:
+                pts = self.frames_written / self.fps
+                self._timecode_file.write(f"{self.frames_written},{pts:.6f},{timestamp:.6f}\n")
+            if self.frames_written < target:
+                self.frames_repeated += 1
+            self.frames_written += 1
+
+
+def _gif_palette():
+    # Fixed 6x7x6 colour cube (252 colours). Quantizing against it is plain
+    # integer arithmetic, so each frame is reduced as it arrives and every
+    # frame in the GIF shares one palette.
+    r, g, b = np.meshgrid(np.arange(6), np.arange(7), np.arange(6), indexing='ij')
+    cube = np.stack([r * 255 // 5, g * 255 // 6, b * 255 // 5], axis=-1).reshape(-1, 3)
+    palette = np.zeros((256, 3), np.uint8)
+    palette[:len(cube)] = cube
+    return palette
+
+
+GIF_PALETTE = _gif_palette()
+
+
+def quantize_gif_frame(rgb):
+    q = rgb.astype(np.uint16)
+    return ((q[..., 0] * 6 >> 8) * 42 + (q[..., 1] * 7 >> 8) * 6 + (q[..., 2] * 6 >> 8)).astype(np.uint8)
+
+
+class GifCapture:
+    # Opt-in rolling GIF buffer: keeps the last `window` seconds at `fps`,
+    # each frame downscaled and stored as palette indices (a third of the
+    # size of RGB). export() writes them out on a background thread.
+    def __init__(self, window=5.0, fps=10.0, size=(320, 240)):
+        self.window = window
+        self.fps = fps
+        self.size = size
+        self.exporting = False
+        self._frames = collections.deque(maxlen=max(1, int(window * fps)))
+        self._last = None
+        self._small = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def offer(self, frame, timestamp):
+        # Frame decimation: anything closer than 1/fps to the last kept
+        # frame is ignored before it costs a resize.
+        if self._last is not None and timestamp - self._last < 0.95 / self.fps:
+            return
+        self._last = timestamp
+        self._small = cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        small = self._small
+        indices = quantize_gif_frame(small[..., ::-1])
+        with self._lock:
+            self._frames.append((timestamp, indices))
+            while self._frames and timestamp - self._frames[0][0] > self.window:
+                self._frames.popleft()
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._last = None
+
+    def export(self, path, done=None):
+        with self._lock:
+            frames = list(self._frames)
+        if not frames:
+            return None
+        self.exporting = True
+        thread = threading.Thread(target=self._write, args=(path, frames, done), name="pose-gif", daemon=True)
+        thread.start()
+        return thread
+
+    def _write(self, path, frames, done):
+        from PIL import Image
+
+        error = None
+        try:
+            # The stored indices go out as they are, against the shared
+            # palette: nothing is quantized a second time.
+            palette = GIF_PALETTE.tobytes()
+            images = []
+            for _, indices in frames:
+                image = Image.fromarray(indices, 'P')
+                image.putpalette(palette)
+                images.append(image)
+            images[0].save(
+                path, save_all=True, append_images=images[1:], duration=int(1000 / self.fps),
+                loop=0, optimize=False,
+            )
+        except Exception as e:
+            error = e
+            print("GIF Error:", e)
+        finally:
+            self.exporting = False
+        if done is not None:
+            done(path, error)
@@ -0,0 +1,374 @@
+import argparse
+import csv
+import datetime
+import glob
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+# On-disk layout, all append-only:
+#   <root>/sessions.jsonl                  final summary of every closed session
+#   <root>/<station>/<session>/
+#       chunk-00000.npz ...                frames and events, a few seconds each
+#       index.jsonl                        one line per chunk: time range, frame
+#                                          range and event counts by kind
+#       summary.json                       running totals, rewritten per chunk
+# A chunk counts once its index line is written, so a crash loses at most
+# the chunk being written. Queries read the index first and then only the
+# arrays they need from the chunks that overlap the requested time range
+# and hold the requested kind of event.
+
+CHUNK_FIELDS = ("frame", "timestamp", "person", "landmarks")
+EVENT_FIELDS = ("timestamp", "frame", "person", "kind", "value", "label")
+
+
+def _replace_json(path, data):
+    with open(path + '.part', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.part', path)
+
+
+def _read_jsonl(path):
+    # A torn last line (the writer died mid-append) is skipped.
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return entries
+
+
+def merge_summaries(summaries):
+    # Totals over several session summaries.
+    total = {"sessions": 0, "start": None, "end": None, "frames": 0, "duration": 0.0, "events": {}}
+    for s in summaries:
+        total["sessions"] += 1
+        total["frames"] += s["frames"]
+        if s["start"] is not None:
+            total["start"] = s["start"] if total["start"] is None else min(total["start"], s["start"])
+            total["end"] = s["end"] if total["end"] is None else max(total["end"], s["end"])
+            total["duration"] += s["end"] - s["start"]
+        for kind, n in s["events"].items():
+            total["events"][kind] = total["events"].get(kind, 0) + n
+    return total
+
+
+class SessionRecorder:
+    # Records one session: per-frame landmarks (one row per tracked person)
+    # plus rule, rep and flow events. Rows are buffered by the caller's
+    # thread and handed to a writer thread every chunk_frames frames or
+    # chunk_seconds, whichever comes first. Like LandmarkWriter, it never
+    # blocks the caller: chunks that find max_pending already waiting are
+    # dropped and counted, and after a write error (kept in .error) the
+    # rest are discarded.
+    def __init__(self, root, station=None, session=None, chunk_frames=300, chunk_seconds=30.0, max_pending=8):
+        self.station = station or os.environ.get("NEON_POSE_STATION") or socket.gethostname()
+        self.session = session or time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+        self.root = root
+        self.path = os.path.join(root, self.station, self.session)
+        os.makedirs(self.path, exist_ok=True)
+        self.chunk_frames = chunk_frames
+        self.chunk_seconds = chunk_seconds
+        self.summary = {
+            "station": self.station, "session": self.session, "start": None, "end": None,
+            "frames": 0, "chunks": 0, "events": {}, "closed": False,
+        }
+        self.chunks_dropped = 0
+        self.error = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._reset_buffer()
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+        self._thread.start()
+
+    def _reset_buffer(self):
+        self._frames = {name: [] for name in CHUNK_FIELDS}
+        self._events = {name: [] for name in EVENT_FIELDS}
+        self._first = None
+
+    def add_frame(self, frame_index, timestamp, landmarks, person=0):
+        with self._lock:
+            frames = self._frames
+            frames["frame"].append(frame_index)
+            frames["timestamp"].append(timestamp)
+            frames["person"].append(person)
+            frames["landmarks"].append(landmarks)
+            self._added(timestamp)
+
+    def add_event(self, timestamp, kind, value=None, frame=-1, person=0):
+        # value: a number, or a string (e.g. the pose name), kept as label.
+        label = ""
+        if isinstance(value, str):
+            value, label = None, value
+        with self._lock:
+            events = self._events
+            events["timestamp"].append(timestamp)
+            events["frame"].append(frame)
+            events["person"].append(person)
+            events["kind"].append(kind)
+            events["value"].append(np.nan if value is None else float(value))
+            events["label"].append(label)
+            self._added(timestamp)
+
+    def _added(self, timestamp):
+        if self._first is None:
+            self._first = timestamp
+        if len(self._frames["frame"]) >= self.chunk_frames or timestamp - self._first >= self.chunk_seconds:
+            self._flush()
+
+    def _flush(self):
+        frames, events = self._frames, self._events
+        if not frames["frame"] and not events["kind"]:
+            return
+        self._reset_buffer()
+        chunk = {
+            "frame": np.array(frames["frame"], np.int64),
+            "timestamp": np.array(frames["timestamp"], np.float64),
+            "person": np.array(frames["person"], np.int32),
+            "landmarks": np.array(frames["landmarks"], np.float32).reshape(-1, 33, 4),
+            "event_timestamp": np.array(events["timestamp"], np.float64),
+            "event_frame": np.array(events["frame"], np.int64),
+            "event_person": np.array(events["person"], np.int32),
+            "event_kind": np.array(events["kind"], str),
+            "event_value": np.array(events["value"], np.float64),
+            "event_label": np.array(events["label"], str),
+        }
+        if self.error is not None:
+            self.chunks_dropped += 1
+            return
+        try:
+            self._queue.put_nowait(chunk)
+        except queue.Full:
+            self.chunks_dropped += 1
+
+    def close(self, wait=True, timeout=None):
+        # The writer finishes what is queued, then stops.
+        with self._lock:
+            self._flush()
+            self._closed = True
+        if wait:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed:
+                    break
+                continue
+            if self.error is not None:
+                self.chunks_dropped += 1
+                continue
+            try:
+                self._write(chunk)
+            except Exception as e:
+                print("Session Store Error:", e)
+                self.error = e
+        self.summary["chunks_dropped"] = self.chunks_dropped
+        try:
+            self.summary["closed"] = True
+            _replace_json(os.path.join(self.path, "summary.json"), self.summary)
+            with open(os.path.join(self.root, "sessions.jsonl"), 'a') as f:
+                f.write(json.dumps(self.summary) + '\n')
+        except Exception as e:
+            print("Session Store Error:", e)
+
+    def _write(self, chunk):
+        name = f"chunk-{self.summary['chunks']:05d}.npz"
+        path = os.path.join(self.path, name)
+        with open(path + '.part', 'wb') as f:
+            np.savez_compressed(f, **chunk)
+        os.replace(path + '.part', path)
+
+        times = np.concatenate([chunk["timestamp"], chunk["event_timestamp"]])
+        kinds, counts = np.unique(chunk["event_kind"], return_counts=True)
+        kinds = {str(k): int(n) for k, n in zip(kinds, counts)}
+        entry = {
+            "file": name,
+            "t0": float(times.min()),
+            "t1": float(times.max()),
+            "frames": len(chunk["frame"]),
+            "first_frame": int(chunk["frame"][0]) if len(chunk["frame"]) else None,
+            "last_frame": int(chunk["frame"][-1]) if len(chunk["frame"]) else None,
+            "events": kinds,
+        }
+        with open(os.path.join(self.path, "index.jsonl"), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+        # The running totals only ever add this chunk's numbers.
+        s = self.summary
+        s["start"] = entry["t0"] if s["start"] is None else min(s["start"], entry["t0"])
+        s["end"] = entry["t1"] if s["end"] is None else max(s["end"], entry["t1"])
+        s["frames"] += entry["frames"]
+        s["chunks"] += 1
+        for kind, n in kinds.items():
+            s["events"][kind] = s["events"].get(kind, 0) + n
+        _replace_json(os.path.join(self.path, "summary.json"), s)
+
+
+class SessionReader:
+    # Range queries over one recorded session (also while it is still
+    # being recorded: chunks written so far are visible).
+    def __init__(self, path):
+        self.path = path
+        self.index = _read_jsonl(os.path.join(path, "index.jsonl"))
+        self._t0 = np.array([e["t0"] for e in self.index], np.float64)
+        self._t1 = np.array([e["t1"] for e in self.index], np.float64)
+
+    def summary(self):
+        with open(os.path.join(self.path, "summary.json")) as f:
+            return json.load(f)
+
+    def chunks(self, t0=None, t1=None, kind=None):
+        # Index entries overlapping [t0, t1]; with `kind`, only those
+        # holding at least one event of that kind.
+        hit = np.ones(len(self.index), bool)
+        if t0 is not None:
+            hit &= self._t1 >= t0
+        if t1 is not None:
+            hit &= self._t0 <= t1
+        return [
+            self.index[i] for i in np.flatnonzero(hit)
+            if kind is None or self.index[i]["events"].get(kind)
+        ]
+
+    def frames(self, t0=None, t1=None, person=None):
+        # {"frame", "timestamp", "person", "landmarks"} within [t0, t1].
+        parts = []
+        for entry in self.chunks(t0, t1):
+            if not entry["frames"]:
+                continue
+            with np.load(os.path.join(self.path, entry["file"])) as z:
+                part = {name: z[name] for name in CHUNK_FIELDS}
+            keep = self._mask(part["timestamp"], t0, t1)
+            if person is not None:
+                keep &= part["person"] == person
+            parts.append({name: part[name][keep] for name in CHUNK_FIELDS})
+        if not parts:
+            return {
+                "frame": np.zeros(0, np.int64), "timestamp": np.zeros(0, np.float64),
+                "person": np.zeros(0, np.int32), "landmarks": np.zeros((0, 33, 4), np.float32),
+            }
+        return {name: np.concatenate([p[name] for p in parts]) for name in CHUNK_FIELDS}
+
+    def events(self, t0=None, t1=None, kind=None):
+        # Events within [t0, t1] as (timestamp, frame, person, kind, value,
+        # label) tuples, oldest first. Landmark arrays are never read.
+        rows = []
+        for entry in self.chunks(t0, t1, kind):
+            if not entry["events"]:
+                continue
+            with np.load(os.path.join(self.path, entry["file"])) as z:
+                cols = [z["event_" + name] for name in EVENT_FIELDS]
+            keep = self._mask(cols[0], t0, t1)
+            if kind is not None:
+                keep &= cols[3] == kind
+            for i in np.flatnonzero(keep):
+                rows.append((
+                    float(cols[0][i]), int(cols[1][i]), int(cols[2][i]),
+                    str(cols[3][i]), float(cols[4][i]), str(cols[5][i]),
+                ))
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def _mask(self, times, t0, t1):
+        keep = np.ones(len(times), bool)
+        if t0 is not None:
+            keep &= times >= t0
+        if t1 is not None:
+            keep &= times <= t1
+        return keep
+
+
+class SessionStore:
+    # All sessions under one root, from any number of stations. Closed
+    # sessions are listed from the root catalog; sessions still recording
+    # (or cut short) from their own summary.json.
+    def __init__(self, root):
+        self.root = root
+
+    def sessions(self, station=None, since=None, until=None):
+        found = {}
+        for s in _read_jsonl(os.path.join(self.root, "sessions.jsonl")):
+            found[(s["station"], s["session"])] = s
+        for path in glob.glob(os.path.join(glob.escape(self.root), "*", "*", "summary.json")):
+            session_dir = os.path.dirname(path)
+            key = (os.path.basename(os.path.dirname(session_dir)), os.path.basename(session_dir))
+            if key in found:
+                continue
+            try:
+                with open(path) as f:
+                    found[key] = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+        selected = []
+        for (st, session), s in sorted(found.items(), key=lambda item: item[1]["start"] or 0.0):
+            if station is not None and st != station:
+                continue
+            if s["start"] is None:
+                continue
+            if (since is not None and s["end"] < since) or (until is not None and s["start"] > until):
+                continue
+            selected.append(dict(s, path=os.path.join(self.root, st, session)))
+        return selected
+
+    def summary(self, station=None, since=None, until=None):
+        # Whole sessions overlapping [since, until], from their summaries.
+        return merge_summaries(self.sessions(station, since, until))
+
+    def events(self, kind=None, since=None, until=None, station=None):
+        # Events across sessions; sessions without that kind are skipped
+        # from their summaries alone.
+        rows = []
+        for s in self.sessions(station, since, until):
+            if kind is not None and not s["events"].get(kind):
+                continue
+            for row in SessionReader(s["path"]).events(since, until, kind):
+                rows.append((s["station"], s["session"]) + row)
+        return rows
+
+
+def _parse_time(text):
+    # Seconds since the epoch, or an ISO date / date and time (local time).
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.datetime.fromisoformat(text).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query recorded pose tracking sessions.")
+    parser.add_argument("root", help="session store directory")
+    parser.add_argument("--station", help="only this station")
+    parser.add_argument("--since", type=_parse_time, help="start time (epoch seconds or ISO date/time)")
+    parser.add_argument("--until", type=_parse_time, help="end time (epoch seconds or ISO date/time)")
+    parser.add_argument("--events", metavar="KIND", help="list events of this kind (e.g. rep, posture) as CSV")
+    parser.add_argument("--sessions", action="store_true", help="print one summary per session")
+    args = parser.parse_args(argv)
+
+    store = SessionStore(args.root)
+    if args.events:
+        out = csv.writer(sys.stdout)
+        out.writerow(("station", "session") + EVENT_FIELDS)
+        out.writerows(store.events(args.events, args.since, args.until, args.station))
+    elif args.sessions:
+        for s in store.sessions(args.station, args.since, args.until):
+            print(json.dumps(s))
+    else:
+        print(json.dumps(store.summary(args.station, args.since, args.until), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+
+from pose_pipeline import DropOldestQueue
+
+_WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+
+_INDEX_PAGE = b"""<!doctype html>
+<title>Neon Pose Tracker</title>
+<body style="background:#111;color:#eee;font-family:sans-serif">
+<img src="/stream.mjpg" style="max-width:100%"><pre id="events"></pre>
+<script>
+const ws = new WebSocket(`ws://${location.host}/events`);
+ws.onmessage = (m) => {
+  const e = JSON.parse(m.data);
+  document.getElementById("events").textContent =
+    `frame ${e.frame}  people ${e.people.length}  ${e.reps || ""}\\n${e.feedback}`;
+};
+</script>
+"""
+
+
+def _ws_frame(payload, opcode=0x1):
+    # One unmasked, unfragmented server-to-client WebSocket frame.
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def packet_event(packet, **fields):
+    # Compact JSON-ready summary of one finished frame: landmarks rounded
+    # to 4 decimals, one entry per tracked person.
+    if packet.people is not None:
+        people = [(person.id, pose_frame) for person, pose_frame in packet.people]
+    elif packet.pose_frame is not None:
+        people = [(0, packet.pose_frame)]
+    else:
+        people = []
+    event = {
+        "frame": packet.index,
+        "timestamp": round(packet.timestamp, 4),
+        "feedback": packet.feedback,
+        "people": [
+            {"id": person_id, "landmarks": pose_frame.data.round(4).tolist()}
+            for person_id, pose_frame in people
+        ],
+    }
+    event.update(fields)
+    return event
+
+
+class StreamServer:
+    # Serves the annotated video and per-frame landmark events to other
+    # programs on the network, straight from the pipeline:
+    #   /stream.mjpg  MJPEG over HTTP (any browser, OBS media source, VLC)
+    #   /events       landmark/feedback JSON over WebSocket, or as
+    #                 Server-Sent Events for plain HTTP clients
+    #   /             a small viewer page
+    # and optionally pushes the same JSON as UDP datagrams to udp_targets.
+    # Each client has its own small drop-oldest queue, so a slow viewer
+    # only loses its own frames and never holds up the pipeline. Frames are
+    # JPEG-encoded once, at most max_fps times a second, and only while
+    # someone is watching.
+    def __init__(self, port=8080, host="127.0.0.1", jpeg_quality=80, max_fps=15.0,
+                 udp_targets=None, metrics=None):
+        self.jpeg_quality = jpeg_quality
+        self.max_fps = max_fps
+        self.metrics = metrics
+        self.udp_targets = list(udp_targets or [])
+        self.frames_sent = 0
+        self.events_sent = 0
+        self._video_clients = set()
+        self._event_clients = set()
+        self._clients_lock = threading.Lock()
+        self._last_frame_time = None
+        self._udp = None
+        if self.udp_targets:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._udp.setblocking(False)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # WebSocket upgrades need an HTTP/1.1 101 response (RFC 6455).
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path == "/stream.mjpg":
+                    server._serve_video(self)
+                elif self.path == "/events":
+                    server._serve_events(self)
+                elif self.path in ("/", "/index.html"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html")
+                    self.send_header("Content-Length", str(len(_INDEX_PAGE)))
+                    self.end_headers()
+                    self.wfile.write(_INDEX_PAGE)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="pose-stream-http", daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        with self._clients_lock:
+            video, events = list(self._video_clients), list(self._event_clients)
+        return {
+            "video_clients": len(video),
+            "event_clients": len(events),
+            "frames_sent": self.frames_sent,
+            "events_sent": self.events_sent,
+            "dropped": sum(q.dropped for q in video + events),
+        }
+
+    def publish_packet(self, packet, **fields):
+        # Engine sink: call from the sink thread with each finished packet.
+        # Extra keyword fields (e.g. reps) are added to the event.
+        self.publish_frame(packet.frame, packet.timestamp)
+        if self._event_clients or self._udp is not None:
+            self.publish_event(packet_event(packet, **fields))
+
+    def publish_frame(self, frame, timestamp=None):
+        if not self._video_clients:
+            return
+        now = time.monotonic()
+        if self.max_fps and self._last_frame_time is not None and now - self._last_frame_time < 1.0 / self.max_fps:
+            return
+        self._last_frame_time = now
+        start = time.perf_counter()
+        ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if self.metrics is not None:
+            self.metrics.record("stream_encode", time.perf_counter() - start)
+        if not ok:
+            return
+        data = jpeg.tobytes()
+        with self._clients_lock:
+            clients = list(self._video_clients)
+        for q in clients:
+            q.put(data)
+
+    def publish_event(self, event):
+        payload = json.dumps(event, separators=(",", ":")).encode()
+        with self._clients_lock:
+            clients = list(self._event_clients)
+        for q in clients:
+            q.put(payload)
+        for target in self.udp_targets:
+            try:
+                self._udp.sendto(payload, target)
+            except OSError:
+                pass  # nobody listening / datagram too large: UDP is best effort
+        self.events_sent += 1
+
+    def stop(self):
+        with self._clients_lock:
+            clients = list(self._video_clients | self._event_clients)
+        for q in clients:
+            q.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._udp is not None:
+            self._udp.close()
+
+    def _serve_video(self, handler):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        self._pump(handler, self._video_clients, DropOldestQueue(2), lambda data: (
+            b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(data) + data + b"\r\n"
+        ), count="frames_sent")
+
+    def _serve_events(self, handler):
+        key = handler.headers.get("Sec-WebSocket-Key")
+        if key and handler.headers.get("Upgrade", "").lower() == "websocket":
+            accept = base64.b64encode(hashlib.sha1(key.encode() + _WS_GUID).digest()).decode()
+            handler.send_response(101, "Switching Protocols")
+            handler.send_header("Upgrade", "websocket")
+            handler.send_header("Connection", "Upgrade")
+            handler.send_header("Sec-WebSocket-Accept", accept)
+            handler.end_headers()
+            wrap = _ws_frame
+        else:
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.send_header("Cache-Control", "no-cache")
+            handler.send_header("Connection", "close")
+            handler.end_headers()
+            wrap = lambda payload: b"data: " + payload + b"\n\n"
+        self._pump(handler, self._event_clients, DropOldestQueue(64), wrap)
+
+    def _pump(self, handler, registry, q, wrap, count=None):
+        # Runs on the client's own server thread until it disconnects.
+        with self._clients_lock:
+            registry.add(q)
+        try:
+            while not q.closed:
+                item = q.get(timeout=0.5)
+                if item is None:
+                    continue
+                handler.wfile.write(wrap(item))
+                handler.wfile.flush()
+                if count is not None:
+                    setattr(self, count, getattr(self, count) + 1)
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            with self._clients_lock:
+                registry.discard(q)
+            handler.close_connection = True